@@ -10,6 +10,8 @@ from discord.ext import commands
 from collections import defaultdict
 from unidecode import unidecode
 
+from utilities import db
+from utilities import pools
 from utilities import utils
 from utilities import views
 from utilities import checks
@@ -1481,11 +1483,9 @@ class Admin(commands.Cog):
                         AND inviter = $2;
                         """
             elif option == "messages":
-                query = """
-                        DELETE FROM messages
-                        WHERE server_id = $1
-                        AND author_id = $2;
-                        """
+                query = None  # Their counts and activity go with them.
+                async with pools.unbounded(self.bot.cxn) as conn:
+                    await db.reset_messages(conn, ctx.guild.id, user.id)
             elif option == "nicknames":
                 query = """
                         DELETE FROM usernicks
@@ -1493,7 +1493,8 @@ class Admin(commands.Cog):
                         AND user_id = $2;
                         """
 
-            await self.bot.cxn.execute(query, ctx.guild.id, user.id)
+            if query:
+                await self.bot.cxn.execute(query, ctx.guild.id, user.id)
             await ctx.success(f"Reset all {option[:-1]} data for `{user}`")
 
     @_reset.command(
@@ -1526,10 +1527,9 @@ class Admin(commands.Cog):
                         WHERE server_id = $1;
                         """
             elif option == "messages":
-                query = """
-                        DELETE FROM messages
-                        WHERE server_id = $1;
-                        """
+                query = None  # Their counts and activity go with them.
+                async with pools.unbounded(self.bot.cxn) as conn:
+                    await db.reset_messages(conn, ctx.guild.id)
             elif option == "nicknames":
                 query = """
                         DELETE FROM usernicks
@@ -1541,7 +1541,8 @@ class Admin(commands.Cog):
                         WHERE server_id = $1;
                         """
 
-            await self.bot.cxn.execute(query, ctx.guild.id)
+            if query:
+                await self.bot.cxn.execute(query, ctx.guild.id)
             await ctx.success(f"Reset all {option[:-1]} data for this server.")
 
     @decorators.command(
@@ -1572,7 +1573,8 @@ class Admin(commands.Cog):
                 )
             else:
                 await message.edit(
-                    f"Successfully opted out of all data tracking systems."
+                    "Successfully opted out of all data tracking systems. "
+                    "Your stored data is being deleted in the background."
                 )
 
     @decorators.command(
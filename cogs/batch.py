@@ -1,22 +1,57 @@
 import re
+import os
 import json
 import time
 import asyncio
+import asyncpg
 import discord
 import logging
+import functools
 
-from collections import Counter, defaultdict
+from collections import Counter, defaultdict, deque
 from datetime import datetime
 from discord.ext import commands, tasks
 
+from utilities import db
+from utilities import cache
+from utilities import ingest
+from utilities import pools
+from utilities import queries
+from utilities import spool
 from utilities import utils
 from utilities import decorators
 
 command_logger = logging.getLogger("COMMAND_LOGGER")
+info_logger = logging.getLogger("INFO_LOGGER")
 
 EMOJI_REGEX = re.compile(r"<a?:.+?:([0-9]{15,21})>")
 EMOJI_NAME_REGEX = re.compile(r"[0-9a-zA-Z\_]{2,32}")
 
+# Upper bounds on the in memory last seen and last spoke indexes.
+SEEN_CACHE_SIZE = 50000
+SPOKE_CACHE_SIZE = 100000
+# Upper bound on the last recorded statuses used to dedupe presences.
+PRESENCE_CACHE_SIZE = 100000
+
+# Guilds whose invites are fetched per tick, and the pause between them.
+INVITE_REFRESH_GUILDS = 5
+INVITE_REFRESH_DELAY = 1.0
+
+# Monthly messages partitions are created this many months ahead.
+PARTITION_MONTHS_AHEAD = 2
+
+# Erasure chunks are resized to take about ERASURE_TARGET seconds.
+# The eraser rests as long as each chunk took, and checks for new
+# jobs every ERASURE_IDLE seconds when there are none. A job that
+# fails is retried after ERASURE_IDLE seconds, doubling per failure
+# up to ERASURE_MAX_BACKOFF, while the other jobs keep going.
+ERASURE_CHUNK = 1000
+ERASURE_MIN_CHUNK = 100
+ERASURE_MAX_CHUNK = 10000
+ERASURE_TARGET = 0.1
+ERASURE_IDLE = 10.0
+ERASURE_MAX_BACKOFF = 600.0
+
 
 async def setup(bot):
     await bot.add_cog(Batch(bot))
@@ -36,32 +71,100 @@ class Batch(commands.Cog):
         # Removed for now at least
         # self.activity_batch = defaultdict(dict)
 
-        # Data holders
-        self.command_batch = []
-        self.emote_batch = defaultdict(dict)
-        self.invite_batch = []
-        self.message_batch = []
-        self.nicknames_batch = []
-        self.presence_batch = []
-        self.roles_batch = defaultdict(dict)
-        self.status_batch = defaultdict(dict)
-        self.tracking_batch = defaultdict(dict)
-        self.usernames_batch = []
-        self.voice_batch = []
-
-        self.batch_lock = asyncio.Lock()
+        # Data holders, one ingest.Partition per shard. Each has
+        # its own flush loops so a busy shard can't hold up the rest.
+        self.partitions = {}  # shard_id: Partition
+        self.metrics = ingest.Metrics()
+        self.invite_joins = defaultdict(deque)  # guild_id: members to attribute
+        self.invite_seeds = deque()  # Guilds without cached invites
+
+        # Last recorded status of each user, user_id: status
+        self.presences = cache.LRU(PRESENCE_CACHE_SIZE)
+
+        # Recent activity, answers the seen and spoke lookups
+        # without a query. Postgres is only asked on a miss.
+        self.last_seen = cache.LRU(SEEN_CACHE_SIZE)  # user_id: (unix, action)
+        self.last_spoke = cache.LRU(SEEN_CACHE_SIZE)  # user_id: unix
+        # (server_id, user_id): unix
+        self.server_last_spoke = cache.LRU(SPOKE_CACHE_SIZE)
+
         self.queue = asyncio.Queue()
 
-        self.bulk_inserter.start()
+        # Append only tables are written with COPY unless
+        # this is disabled, then we fall back to JSONB.
+        self.copy_mode = True
+
+        # Set once messages is a view over message_log,
+        # loaded from the database on the first flush.
+        self.compacted = None
+
+        self.erasure_chunk = ERASURE_CHUNK  # Rows per erasure delete
+        self.erasure_failures = {}  # Job id: (failures, retry at)
+
+        # Every write goes through here so batches survive an outage.
+        # They are spooled to ./data/spool and replayed in order.
+        writers = {
+            table: functools.partial(self.write_records, table) for table in db.LAYOUTS
+        }
+        writers.update(
+            {table: functools.partial(self.write_rollup, table) for table in db.ROLLUPS}
+        )
+        writers["messages"] = self.write_messages
+        writers["activity_days"] = self.write_activity_days
+        writers["emojidata"] = self.write_emojis
+        writers["tracker"] = self.write_tracking
+        writers["userroles"] = self.write_roles
+        writers["userstatus"] = self.write_statuses
+        self.writer = spool.DurableWriter(
+            writers, "./data/spool", error_handler=self.write_error
+        )
+
         self.invite_tracker.start()
-        self.message_inserter.start()
-        self.status_inserter.start()
+        self.partition_manager.start()
+        self.message_backfill.start()
+        self.eraser.start()
+        self.replayer.start()
 
     def cog_unload(self):
-        self.bulk_inserter.stop()
-        self.message_inserter.stop()
-        self.status_inserter.stop()
+        for partition in self.partitions.values():
+            for loop in partition.loops:
+                loop.stop()
         self.invite_tracker.stop()
+        self.partition_manager.stop()
+        self.message_backfill.stop()
+        self.eraser.stop()
+        self.replayer.stop()
+        self.writer.spill()  # Keep queued batches across reloads
+
+    async def flush_error(self, loop, partition, exc):
+        self.metrics.errors[loop] += 1
+        self.bot.dispatch("error", "loop_error", tb=utils.traceback_maker(exc))
+
+    def partition(self, guild=None, *, user_id=None):
+        """
+        Get the partition for a guild's shard. Data about a user
+        rather than a guild is keyed by their id instead, so
+        all of one user's events land in the same partition.
+        """
+        if guild is not None:
+            shard_id = guild.shard_id
+        elif user_id is not None:
+            shard_id = (user_id >> 22) % (self.bot.shard_count or 1)
+        else:
+            shard_id = 0
+
+        partition = self.partitions.get(shard_id)
+        if partition is None:
+            partition = self.partitions[shard_id] = ingest.Partition(shard_id)
+            for interval, flusher in (
+                (0.5, self.message_inserter),
+                (2.0, self.bulk_inserter),
+            ):
+                loop = tasks.loop(seconds=interval)(flusher)
+                loop.error(functools.partial(self.flush_error, flusher.__name__))
+                loop.start(partition)
+                partition.loops.append(loop)
+        return partition
 
     async def load_whitelist(self):
         query = "SELECT ARRAY(SELECT user_id FROM whitelist);"
@@ -71,6 +174,7 @@ class Batch(commands.Cog):
         self.whitelist.remove(user_id)
         query = "DELETE FROM whitelist WHERE user_id = $1"
         await self.bot.cxn.execute(query, user_id)
+        await db.cancel_erasure(self.bot.cxn, "user", user_id)
 
     async def opt_out(self, user_id):
         query = "INSERT INTO whitelist VALUES ($1);"
@@ -78,178 +182,520 @@ class Batch(commands.Cog):
         self.whitelist.append(user_id)
         await self.delete_all(user_id)
 
+    def forget(self, user_id):
+        """
+        Drop a user from the in memory indexes.
+        """
+        self.last_seen.pop(user_id)
+        self.last_spoke.pop(user_id)
+        for key in [key for key in self.server_last_spoke.keys() if key[1] == user_id]:
+            self.server_last_spoke.pop(key)
+
     async def delete_all(self, user_id):
-        queries = [
-            """
-            WITH data AS (
-                DELETE FROM useravatars
-                WHERE user_id = $1
-                RETURNING avatar
-            )
-            DELETE FROM avatars
-            WHERE hash IN (
-                SELECT avatar
-                FROM data
-            );
-            """,
-            """
-            DELETE FROM usernames
-            WHERE user_id = $1; 
-            """,
-            """
-            DELETE FROM usernicks
-            WHERE user_id = $1;
-            """,
-            """
-            DELETE FROM userstatus
-            WHERE user_id = $1;
-            """,
-            """
-            DELETE FROM tracker
-            WHERE user_id = $1;
-            """,
-            """
-            DELETE FROM voice
-            WHERE user_id = $1;
-            """,
-            """
-            DELETE FROM statuses
-            WHERE user_id = $1;
-            """,
-            """
-            DELETE FROM emojidata
-            WHERE author_id = $1;
-            """,
-            """
-            DELETE FROM messages
-            WHERE author_id = $1;
-            """,
-        ]
-        async with self.bot.cxn.acquire() as conn:
-            async with conn.transaction():
-                for query in queries:
-                    await conn.execute(query, user_id)
+        """
+        Queue everything stored on a user for deletion.
+        The eraser loop deletes it in the background.
+        """
+        self.forget(user_id)
+        await db.queue_erasure(self.bot.cxn, "user", user_id)
 
-    @tasks.loop(minutes=1.0)
-    async def invite_tracker(self):
-        self.bot.invites = {
-            guild.id: await guild.invites()
-            for guild in self.bot.guilds
-            if guild.me.guild_permissions.manage_guild
+    def track(self, user_id, action):
+        """
+        Record the latest thing a user was seen doing.
+        """
+        now = time.time()
+        self.partition(user_id=user_id).tracking_batch[user_id] = {now: action}
+        self.last_seen[user_id] = (now, action)
+
+    async def write(self, table, rows):
+        self.metrics.record(table, len(rows))
+        await self.writer.write(table, rows)
+
+    def snapshot(self):
+        """
+        Machine readable state of the ingest pipeline.
+        """
+        buffered = Counter()
+        for partition in self.partitions.values():
+            for name in ingest.CONTAINERS:
+                buffered[name] += len(getattr(partition, name))
+        return {
+            "time": time.time(),
+            "buffered": dict(buffered),
+            "shards": {
+                partition.shard_id: {
+                    "depth": partition.depth,
+                    "latency": partition.latency,
+                }
+                for partition in self.partitions.values()
+            },
+            "writer": {
+                "circuit": self.writer.breaker.state,
+                "pending": self.writer.pending_rows,
+                **self.writer.stats,
+            },
+            "pools": pools.saturation(self.bot.pools),
+            **self.metrics.snapshot(),
         }
 
-    @tasks.loop(seconds=0.5)
-    async def status_inserter(self):
-        if self.status_batch:  # Insert all status changes
-            async with self.batch_lock:
-                if self.status_batch["online"]:
-                    query = """
-                            INSERT INTO userstatus (user_id)
-                            SELECT x.user_id
-                            FROM JSONB_TO_RECORDSET($1::JSONB)
-                            AS x(user_id BIGINT, last_changed DOUBLE PRECISION)
-                            ON CONFLICT (user_id)
-                            DO UPDATE SET last_changed = EXCLUDED.last_changed,
-                            online = userstatus.online + (EXCLUDED.last_changed - userstatus.last_changed);
-                            """
-                    data = json.dumps(
-                        [
-                            {"user_id": user_id, "last_changed": timestamp}
-                            for user_id, timestamp in self.status_batch[
-                                "online"
-                            ].items()
-                        ]
-                    )
-                    await self.bot.cxn.execute(query, data)
-                    self.status_batch["online"].clear()
-                if self.status_batch["idle"]:
-                    query = """
-                            INSERT INTO userstatus (user_id)
-                            SELECT x.user_id
-                            FROM JSONB_TO_RECORDSET($1::JSONB)
-                            AS x(user_id BIGINT, last_changed DOUBLE PRECISION)
-                            ON CONFLICT (user_id)
-                            DO UPDATE SET last_changed = EXCLUDED.last_changed,
-                            idle = userstatus.idle + (EXCLUDED.last_changed - userstatus.last_changed);
-                            """
-                    data = json.dumps(
-                        [
-                            {"user_id": user_id, "last_changed": timestamp}
-                            for user_id, timestamp in self.status_batch["idle"].items()
-                        ]
-                    )
-                    await self.bot.cxn.execute(query, data)
-                    self.status_batch["idle"].clear()
-                if self.status_batch["dnd"]:
-                    query = """
-                            INSERT INTO userstatus (user_id)
-                            SELECT x.user_id
-                            FROM JSONB_TO_RECORDSET($1::JSONB)
-                            AS x(user_id BIGINT, last_changed DOUBLE PRECISION)
-                            ON CONFLICT (user_id)
-                            DO UPDATE SET last_changed = EXCLUDED.last_changed,
-                            dnd = userstatus.dnd + (EXCLUDED.last_changed - userstatus.last_changed)
-                            """
-                    data = json.dumps(
-                        [
-                            {"user_id": user_id, "last_changed": timestamp}
-                            for user_id, timestamp in self.status_batch["dnd"].items()
-                        ]
+    def write_error(self, exc):
+        self.metrics.errors["writer"] += 1
+        self.bot.dispatch("error", "batch_error", tb=utils.traceback_maker(exc))
+
+    async def write_records(self, table, records, *, cxn=None):
+        """
+        Bulk insert tuples laid out as in db.LAYOUTS
+        """
+        cxn = cxn or self.bot.ingest_cxn
+        if self.copy_mode:
+            await db.copy_records(cxn, table, records)
+        else:
+            await db.jsonb_records(cxn, table, records)
+
+    async def write_messages(self, rows):
+        """
+        Rows are laid out as db.LAYOUTS["messages"]. Only the ids
+        go to message_log, the wide rows are also written to
+        messages until the backfill replaces it with a view.
+        """
+        compact = [row[2:] for row in rows]
+        if self.compacted is None:
+            self.compacted = await db.messages_compacted(self.bot.ingest_cxn)
+        if self.compacted:
+            await self.write_records("message_log", compact)
+            return
+
+        # One transaction, so the ids are never written twice.
+        try:
+            async with self.bot.ingest_cxn.acquire() as conn:
+                async with conn.transaction():
+                    await self.write_records("messages", rows, cxn=conn)
+                    await self.write_records("message_log", compact, cxn=conn)
+        except asyncpg.PostgresError:
+            # Started before the backfill stopped dual writes and
+            # queued on the swap's lock, so it ran against the view.
+            # Both halves rolled back, only message_log needs them.
+            if not await db.messages_compacted(self.bot.ingest_cxn):
+                raise
+            self.compacted = True
+            await self.write_records("message_log", compact)
+
+    async def write_statuses(self, rows):
+        """
+        Rows are (user_id, status, first_changed, last_changed,
+        online, idle, dnd). The status was held from the stored
+        last_changed until first_changed, the last three columns
+        hold the time spent in each status after that.
+        """
+        query = """
+                WITH data AS (
+                    SELECT *
+                    FROM UNNEST(
+                        $1::BIGINT[], $2::TEXT[],
+                        $3::DOUBLE PRECISION[], $4::DOUBLE PRECISION[],
+                        $5::DOUBLE PRECISION[], $6::DOUBLE PRECISION[],
+                        $7::DOUBLE PRECISION[]
+                    ) AS x(user_id, status, first_changed, last_changed, online, idle, dnd)
+                ), updated AS (
+                    UPDATE userstatus
+                    SET online = userstatus.online + data.online + CASE
+                        WHEN data.status = 'online'
+                        THEN data.first_changed - userstatus.last_changed ELSE 0 END,
+                    idle = userstatus.idle + data.idle + CASE
+                        WHEN data.status = 'idle'
+                        THEN data.first_changed - userstatus.last_changed ELSE 0 END,
+                    dnd = userstatus.dnd + data.dnd + CASE
+                        WHEN data.status = 'dnd'
+                        THEN data.first_changed - userstatus.last_changed ELSE 0 END,
+                    last_changed = data.last_changed
+                    FROM data
+                    WHERE userstatus.user_id = data.user_id
+                    RETURNING userstatus.user_id
+                )
+                INSERT INTO userstatus (user_id, online, idle, dnd, last_changed)
+                SELECT user_id, online, idle, dnd, last_changed
+                FROM data
+                WHERE user_id NOT IN (SELECT user_id FROM updated)
+                ON CONFLICT (user_id) DO NOTHING;
+                """
+        await self.bot.ingest_cxn.execute(query, *map(list, zip(*rows)))
+
+    @staticmethod
+    def collapse_statuses(status_batch):
+        """
+        Fold every transition a user made inside
+        one flush window into a single row.
+        """
+        rows = []
+        for user_id, changes in status_batch.items():
+            (status, first_changed), *rest = changes
+            held = {"online": 0.0, "idle": 0.0, "dnd": 0.0}
+            last_changed = first_changed
+            for previous, changed in rest:
+                if previous in held:
+                    held[previous] += changed - last_changed
+                last_changed = changed
+            rows.append(
+                (
+                    user_id,
+                    status,
+                    first_changed,
+                    last_changed,
+                    held["online"],
+                    held["idle"],
+                    held["dnd"],
+                )
+            )
+        return rows
+
+    async def write_emojis(self, rows):
+        """
+        Rows are (server_id, author_id, emoji_id, added)
+        """
+        query = """
+                INSERT INTO emojidata (server_id, author_id, emoji_id, total)
+                SELECT x.server_id, x.author_id, x.emoji_id, x.added
+                FROM JSONB_TO_RECORDSET($1::JSONB)
+                AS x(server_id BIGINT, author_id BIGINT, emoji_id BIGINT, added INT)
+                ON CONFLICT (server_id, author_id, emoji_id) DO UPDATE
+                SET total = emojidata.total + EXCLUDED.total;
+                """
+        data = json.dumps(
+            [
+                {
+                    "server_id": server_id,
+                    "author_id": author_id,
+                    "emoji_id": emoji_id,
+                    "added": count,
+                }
+                for server_id, author_id, emoji_id, count in rows
+            ]
+        )
+        await self.bot.ingest_cxn.execute(query, data)
+
+    async def write_tracking(self, rows):
+        """
+        Rows are (user_id, unix, action)
+        """
+        await db.upsert_last_seen(self.bot.ingest_cxn, rows)
+
+    async def write_rollup(self, table, rows):
+        """
+        Rows are (*key columns, count), see db.ROLLUPS
+        """
+        await db.upsert_rollup(self.bot.ingest_cxn, table, rows)
+
+    @staticmethod
+    def collapse_days(activity_days):
+        """
+        Turn (server_id, user_id, day) entries into
+        (server_id, user_id, last day, bitmap) rows
+        where bit i means active i days before.
+        """
+        days = defaultdict(set)
+        for server_id, user_id, day in activity_days:
+            days[(server_id, user_id)].add(day)
+
+        rows = []
+        for (server_id, user_id), active in days.items():
+            last = max(active)
+            bitmap = 0
+            for day in active:
+                if last - day < 63:
+                    bitmap |= 1 << (last - day)
+            rows.append((server_id, user_id, last, bitmap))
+        return rows
+
+    async def write_activity_days(self, rows):
+        """
+        Rows are (server_id, user_id, day, bitmap)
+        """
+        await db.upsert_activity_days(self.bot.ingest_cxn, rows)
+
+    async def write_roles(self, rows):
+        """
+        Rows are (user_id, server_id, roles)
+        """
+        query = """
+                INSERT INTO userroles (user_id, server_id, roles)
+                SELECT x.user_id, x.server_id, x.roles
+                FROM JSONB_TO_RECORDSET($1::JSONB)
+                AS x(user_id BIGINT, server_id BIGINT, roles TEXT)
+                ON CONFLICT (user_id, server_id)
+                DO UPDATE SET roles = EXCLUDED.roles
+                """
+        data = json.dumps(
+            [
+                {"user_id": user_id, "server_id": server_id, "roles": roles}
+                for user_id, server_id, roles in rows
+            ]
+        )
+        await self.bot.ingest_cxn.execute(query, data)
+
+    @tasks.loop(seconds=5.0)
+    async def replayer(self):
+        await self.writer.replay()
+
+        # Snapshot for anything outside the bot that alerts on ingest lag.
+        with open("./data/json/ingest.json.tmp", "w", encoding="utf-8") as fp:
+            json.dump(self.snapshot(), fp)
+        os.replace("./data/json/ingest.json.tmp", "./data/json/ingest.json")
+
+    @replayer.error
+    async def loop_error(self, exc):
+        self.bot.dispatch("error", "loop_error", tb=utils.traceback_maker(exc))
+
+    @tasks.loop(hours=6.0)
+    async def partition_manager(self):
+        """
+        Keep future message partitions around and drop whole
+        months past config.MESSAGE_RETENTION_MONTHS, if set.
+        Dropping a partition is what retention costs, reads
+        are served by the rollups rather than by pruning.
+        """
+        retention = getattr(self.bot.config, "MESSAGE_RETENTION_MONTHS", None)
+        for table in db.PARTITIONED:
+            # One table failing must not stop the others or the loop.
+            try:
+                created = await db.create_partitions(
+                    self.bot.ingest_cxn, table, months=PARTITION_MONTHS_AHEAD
+                )
+                if created:
+                    info_logger.info(
+                        f"Created {table} partitions: {', '.join(created)}"
                     )
-                    await self.bot.cxn.execute(query, data)
-                    self.status_batch["dnd"].clear()
-                if self.status_batch["offline"]:
-                    query = """
-                            INSERT INTO userstatus (user_id)
-                            SELECT x.user_id
-                            FROM JSONB_TO_RECORDSET($1::JSONB)
-                            AS x(user_id BIGINT, last_changed DOUBLE PRECISION)
-                            ON CONFLICT (user_id)
-                            DO UPDATE SET last_changed = EXCLUDED.last_changed;
-                            """
-                    data = json.dumps(
-                        [
-                            {"user_id": user_id, "last_changed": timestamp}
-                            for user_id, timestamp in self.status_batch[
-                                "offline"
-                            ].items()
-                        ]
+
+                if retention:
+                    dropped = await db.drop_partitions(
+                        self.bot.ingest_cxn, table, months=retention
                     )
-                    await self.bot.cxn.execute(query, data)
-                    self.status_batch["offline"].clear()
+                    if dropped:
+                        info_logger.info(
+                            f"Dropped {table} partitions: {', '.join(dropped)}"
+                        )
+            except Exception as e:
+                self.bot.dispatch("error", "loop_error", tb=utils.traceback_maker(e))
+
+    @partition_manager.before_loop
+    async def before_partition_manager(self):
+        await self.bot.wait_until_ready()
+        while not self.bot.ready:  # Set once every extension is loaded.
+            await asyncio.sleep(5)
+
+    @partition_manager.error
+    async def loop_error(self, exc):
+        self.bot.dispatch("error", "loop_error", tb=utils.traceback_maker(exc))
 
-    @status_inserter.error
+    @tasks.loop(seconds=1.0)
+    async def message_backfill(self):
+        """
+        Copy messages into message_log a server at a time.
+        Stops once messages is a view over message_log.
+        """
+        server_id = await db.backfill_message_log(self.bot.ingest_cxn)
+        if server_id is None:
+            # Stop dual writes first so no batch queues on
+            # the swap's lock and then finds the view.
+            self.compacted = True
+            try:
+                await db.compact_messages(self.bot.ingest_cxn)
+            except Exception:
+                self.compacted = False
+                raise
+            self.message_backfill.stop()
+
+    @message_backfill.before_loop
+    async def before_message_backfill(self):
+        await self.bot.wait_until_ready()
+        while not self.bot.ready:  # Set once every extension is loaded.
+            await asyncio.sleep(5)
+
+    @message_backfill.error
     async def loop_error(self, exc):
         self.bot.dispatch("error", "loop_error", tb=utils.traceback_maker(exc))
 
-    @tasks.loop(seconds=0.5)
-    async def message_inserter(self):
-        """
-        Main bulk message inserter
-        """
-
-        if self.message_batch:  # Insert every message into the db
-            query = """
-                    INSERT INTO messages (unix, timestamp,
-                    message_id, author_id, channel_id, server_id)
-                    SELECT x.unix, x.timestamp,
-                    x.message_id, x.author_id, x.channel_id, x.server_id
-                    FROM JSONB_TO_RECORDSET($1::JSONB)
-                    AS x(unix REAL, timestamp TIMESTAMP,
-                    message_id BIGINT, author_id BIGINT,
-                    channel_id BIGINT, server_id BIGINT)
-                    """
-            async with self.batch_lock:
-                data = json.dumps(self.message_batch)
-                await self.bot.cxn.execute(query, data)
-                self.message_batch.clear()
-
-    @message_inserter.error
+    @tasks.loop(seconds=0)
+    async def eraser(self):
+        """
+        Work through the queued erasure jobs a chunk at a time.
+        Jobs live in the erasure_jobs table so they survive restarts.
+        """
+        try:
+            jobs = await db.pending_erasures(self.bot.ingest_cxn)
+        except Exception as e:
+            self.bot.dispatch("error", "loop_error", tb=utils.traceback_maker(e))
+            await asyncio.sleep(ERASURE_IDLE)
+            return
+
+        now = time.monotonic()
+        jobs = [
+            job
+            for job in jobs
+            if self.erasure_failures.get(job["id"], (0, now))[1] <= now
+        ]
+        if not jobs:
+            await asyncio.sleep(ERASURE_IDLE)
+            return
+
+        start = time.perf_counter()
+        try:
+            job = await db.erase_chunk(self.bot.ingest_cxn, jobs[0], self.erasure_chunk)
+        except Exception as e:
+            self.bot.dispatch("error", "loop_error", tb=utils.traceback_maker(e))
+            failures = self.erasure_failures.get(jobs[0]["id"], (0, 0))[0] + 1
+            backoff = min(ERASURE_MAX_BACKOFF, ERASURE_IDLE * 2 ** (failures - 1))
+            self.erasure_failures[jobs[0]["id"]] = (failures, now + backoff)
+            return
+        elapsed = time.perf_counter() - start
+        self.erasure_failures.pop(jobs[0]["id"], None)
+        if job is None:  # Cancelled by a rejoin or an opt in
+            return
+        if job["finished"]:
+            info_logger.info(
+                f"Erased {job['kind']} [{job['target']}]: {job['deleted']} rows"
+            )
+
+        if elapsed > ERASURE_TARGET:
+            self.erasure_chunk = max(ERASURE_MIN_CHUNK, self.erasure_chunk // 2)
+        elif elapsed < ERASURE_TARGET / 4:
+            self.erasure_chunk = min(ERASURE_MAX_CHUNK, self.erasure_chunk * 2)
+        await asyncio.sleep(elapsed)  # Leave the database time for everyone else
+
+    @eraser.before_loop
+    async def before_eraser(self):
+        await self.bot.wait_until_ready()
+        while not self.bot.ready:  # Set once every extension is loaded.
+            await asyncio.sleep(5)
+
+    @eraser.error
     async def loop_error(self, exc):
         self.bot.dispatch("error", "loop_error", tb=utils.traceback_maker(exc))
 
-    @tasks.loop(seconds=2.0)
-    async def bulk_inserter(self):
+    @tasks.loop(seconds=5.0)
+    async def invite_tracker(self):
+        """
+        Fetch invites only for guilds that had joins, plus
+        any guild not cached yet. Requests are spaced out
+        and a guild is retried later if we get rate limited.
+        """
+        budget = INVITE_REFRESH_GUILDS
+        while budget and (self.invite_joins or self.invite_seeds):
+            budget -= 1
+            if self.invite_joins:
+                guild_id = next(iter(self.invite_joins))
+                joins = self.invite_joins.pop(guild_id)
+            else:
+                guild_id = self.invite_seeds.popleft()
+                joins = None
+
+            guild = self.bot.get_guild(guild_id)
+            if not guild or not guild.me.guild_permissions.manage_guild:
+                continue
+            try:
+                invites = await guild.invites()
+            except discord.HTTPException as e:
+                if e.status == 429:  # Put it back and try next tick.
+                    if joins is None:
+                        self.invite_seeds.appendleft(guild_id)
+                    else:
+                        self.invite_joins[guild_id].extendleft(reversed(joins))
+                    return
+                continue
+
+            changed = self.bot.invites.load(guild_id, invites)
+            if joins:
+                self.attribute_joins(guild_id, joins, changed)
+            await asyncio.sleep(INVITE_REFRESH_DELAY)
+
+    @invite_tracker.before_loop
+    async def before_invite_tracker(self):
+        await self.bot.wait_until_ready()
+        self.invite_seeds.extend(
+            guild.id for guild in self.bot.guilds if guild.id not in self.bot.invites
+        )
+
+    @invite_tracker.error
+    async def loop_error(self, exc):
+        self.bot.dispatch("error", "loop_error", tb=utils.traceback_maker(exc))
+
+    def attribute_joins(self, guild_id, joins, changed):
+        """
+        Hand out the new uses of each invite
+        to the waiting members in join order.
+        """
+        for code, count in changed.items():
+            inviter_id = self.bot.invites.inviters.get(code)
+            for _ in range(count):
+                if not joins:
+                    return
+                member_id = joins.popleft()
+                if inviter_id:
+                    self.partition(self.bot.get_guild(guild_id)).invite_batch.append(
+                        (member_id, inviter_id, guild_id)
+                    )
+
+    async def message_inserter(self, partition):
+        """
+        Main bulk message inserter, runs every
+        half second for each shard's partition.
+        """
+        start = time.perf_counter()
+        async with partition.lock:
+            waited = time.perf_counter() - start
+            message_batch, message_rollup, activity_days, status_batch = partition.swap(
+                "message_batch", "message_rollup", "activity_days", "status_batch"
+            )
+        if not message_batch and not status_batch:
+            return
+
+        if message_batch:  # Insert every message into the db
+            await self.write("messages", message_batch)
+            await self.write(
+                "message_rollups",
+                [(*key, count) for key, count in message_rollup.items()],
+            )
+            await self.write("activity_days", self.collapse_days(activity_days))
+
+        if status_batch:  # Insert all status changes
+            await self.write("userstatus", self.collapse_statuses(status_batch))
+
+        elapsed = time.perf_counter() - start
+        partition.latency["messages"] = elapsed
+        self.metrics.flushed("message_inserter", elapsed, waited)
+
+    async def bulk_inserter(self, partition):
+        start = time.perf_counter()
+        # Swap every container for a fresh one so the listeners
+        # can keep appending while we write the old batches out.
+        async with partition.lock:
+            waited = time.perf_counter() - start
+            batches = partition.swap(
+                "command_batch",
+                "command_rollup",
+                "emote_batch",
+                "tracking_batch",
+                "usernames_batch",
+                "nicknames_batch",
+                "roles_batch",
+                "invite_batch",
+                "voice_batch",
+                "presence_batch",
+            )
+        if not any(batches):
+            return
+        (
+            command_batch,
+            command_rollup,
+            emote_batch,
+            tracking_batch,
+            usernames_batch,
+            nicknames_batch,
+            roles_batch,
+            invite_batch,
+            voice_batch,
+            presence_batch,
+        ) = batches
+
         # if self.activity_batch:
         #     query = """
         #                 INSERT INTO activities (user_id, activity, insertion)
@@ -272,185 +718,100 @@ class Batch(commands.Cog):
         #     await self.bot.cxn.execute(query, data)
         #     self.activity_batch.clear()
 
-        if self.command_batch:  # Insert all the commands executed.
-            query = """
-                    INSERT INTO commands (server_id, channel_id,
-                    author_id, timestamp, prefix, command, failed)
-                    SELECT x.server, x.channel, x.author,
-                    x.timestamp, x.prefix, x.command, x.failed
-                    FROM JSONB_TO_RECORDSET($1::JSONB)
-                    AS x(server BIGINT, channel BIGINT,
-                    author BIGINT, timestamp TIMESTAMP,
-                    prefix TEXT, command TEXT, failed BOOLEAN);
-                    """
-            async with self.batch_lock:
-                data = json.dumps(self.command_batch)
-                await self.bot.cxn.execute(query, data)
-
-                # Command logger to ./data/logs/commands.log
-                destination = None
-                for x in self.command_batch:
-                    if x["server"] is None:
-                        destination = "Private Message"
-                    else:
-                        destination = f"#{self.bot.get_channel(x['channel'])} [{x['channel']}] ({self.bot.get_guild(x['server'])}) [{x['server']}]"
-                    command_logger.info(
-                        f"{self.bot.get_user(x['author'])} in {destination}: {x['content']}"
-                    )
-                self.command_batch.clear()
-
-        # Emoji usage tracking
-        if self.emote_batch:
-            query = """
-                    INSERT INTO emojidata (server_id, author_id, emoji_id, total)
-                    SELECT x.server_id, x.author_id, x.emoji_id, x.added
-                    FROM JSONB_TO_RECORDSET($1::JSONB)
-                    AS x(server_id BIGINT, author_id BIGINT, emoji_id BIGINT, added INT)
-                    ON CONFLICT (server_id, author_id, emoji_id) DO UPDATE
-                    SET total = emojidata.total + EXCLUDED.total;
-                    """
-            async with self.batch_lock:
-                data = json.dumps(
-                    [
-                        {
-                            "server_id": server_id,
-                            "author_id": author_id,
-                            "emoji_id": emoji_id,
-                            "added": count,
-                        }
-                        for server_id, data in self.emote_batch.items()
-                        for author_id, stats in data.items()
-                        for emoji_id, count in stats.items()
-                    ]
+        if command_batch:  # Insert all the commands executed.
+            # The trailing message content is only logged, not stored.
+            await self.write("commands", [row[:-1] for row in command_batch])
+            if command_rollup:
+                await self.write(
+                    "command_rollups",
+                    [(*key, count) for key, count in command_rollup.items()],
                 )
-                await self.bot.cxn.execute(query, data)
-                self.emote_batch.clear()
-
-        if self.tracking_batch:  # Track user last seen times
-            query = """
-                    INSERT INTO tracker (user_id, unix, action)
-                    VALUES ($1, $2, $3)
-                    ON CONFLICT (user_id)
-                    DO UPDATE SET unix = $2, action = $3
-                    WHERE tracker.user_id = $1;
-                    """
-            async with self.batch_lock:
-                await self.bot.cxn.executemany(
-                    query,
-                    (
-                        (user_id, timestamp, description)
-                        for user_id, data in self.tracking_batch.items()
-                        for timestamp, description in data.items()
-                    ),
-                )
-                self.tracking_batch.clear()
-
-        if self.usernames_batch:  # Save usernames
-            query = """
-                    INSERT INTO usernames (user_id, username)
-                    SELECT x.user_id, x.name
-                    FROM JSONB_TO_RECORDSET($1::JSONB)
-                    AS x(user_id BIGINT, name TEXT)
-                    """
-            async with self.batch_lock:
-                data = json.dumps(self.usernames_batch)
-                await self.bot.cxn.execute(query, data)
-                self.usernames_batch.clear()
-
-        if self.nicknames_batch:  # Save user nicknames
-            query = """
-                    INSERT INTO usernicks (user_id, server_id, nickname)
-                    SELECT x.user_id, x.server_id, x.nickname
-                    FROM JSONB_TO_RECORDSET($1::JSONB)
-                    AS x(user_id BIGINT, server_id BIGINT, nickname TEXT)
-                    """
-            async with self.batch_lock:
-                data = json.dumps(self.nicknames_batch)
-                await self.bot.cxn.execute(query, data)
-                self.nicknames_batch.clear()
-
-        if self.roles_batch:  # Insert roles to reassign later.
-            query = """
-                    INSERT INTO userroles (user_id, server_id, roles)
-                    SELECT x.user_id, x.server_id, x.roles
-                    FROM JSONB_TO_RECORDSET($1::JSONB)
-                    AS x(user_id BIGINT, server_id BIGINT, roles TEXT)
-                    ON CONFLICT (user_id, server_id)
-                    DO UPDATE SET roles = EXCLUDED.roles
-                    """
-            async with self.batch_lock:
-                data = json.dumps(
-                    [
-                        {"server_id": server_id, "user_id": user_id, "roles": roles}
-                        for server_id, data in self.roles_batch.items()
-                        for user_id, roles in data.items()
-                    ]
+
+            # Command logger to ./data/logs/commands.log
+            destination = None
+            for server, channel, author, *_, content in command_batch:
+                if server is None:
+                    destination = "Private Message"
+                else:
+                    destination = f"#{self.bot.get_channel(channel)} [{channel}] ({self.bot.get_guild(server)}) [{server}]"
+                command_logger.info(
+                    f"{self.bot.get_user(author)} in {destination}: {content}"
                 )
-                await self.bot.cxn.execute(query, data)
-                self.roles_batch.clear()
-
-        if self.invite_batch:  # Insert invite data for basic tracking
-            query = """
-                    INSERT INTO invites (invitee, inviter, server_id)
-                    SELECT x.invitee, x.inviter, x.server_id
-                    FROM JSONB_TO_RECORDSET($1::JSONB)
-                    AS x(invitee BIGINT, inviter BIGINT, server_id BIGINT)
-                    """
-            async with self.batch_lock:
-                data = json.dumps(self.invite_batch)
-                await self.bot.cxn.execute(query, data)
-                self.invite_batch.clear()
-
-        if self.voice_batch:
-            async with self.batch_lock:
-                query = """
-                        INSERT INTO voice (server_id, user_id, connected, first_seen)
-                        SELECT x.server_id, x.user_id, x.connected, x.first_seen
-                        FROM JSONB_TO_RECORDSET($1::JSONB)
-                        AS x(server_id BIGINT, user_id BIGINT, connected BOOLEAN, first_seen TIMESTAMP);
-                        """
-                data = json.dumps(self.voice_batch)
-                await self.bot.cxn.execute(query, data)
-                self.voice_batch.clear()
-
-        if self.presence_batch:
-            async with self.batch_lock:
-                query = """
-                        INSERT INTO statuses (user_id, status, first_seen)
-                        SELECT x.user_id, x.status, x.first_seen
-                        FROM JSONB_TO_RECORDSET($1::JSONB)
-                        AS x(user_id BIGINT, status TEXT, first_seen TIMESTAMP);
-                        """
-                data = json.dumps(self.presence_batch)
-                await self.bot.cxn.execute(query, data)
-                self.presence_batch.clear()
-
-    @bulk_inserter.error
-    async def loop_error(self, exc):
-        self.bot.dispatch("error", "loop_error", tb=utils.traceback_maker(exc))
+
+        if emote_batch:  # Emoji usage tracking
+            await self.write(
+                "emojidata",
+                [
+                    (server_id, author_id, emoji_id, count)
+                    for server_id, data in emote_batch.items()
+                    for author_id, stats in data.items()
+                    for emoji_id, count in stats.items()
+                ],
+            )
+
+        if tracking_batch:  # Track user last seen times
+            await self.write(
+                "tracker",
+                [
+                    (user_id, timestamp, description)
+                    for user_id, data in tracking_batch.items()
+                    for timestamp, description in data.items()
+                ],
+            )
+
+        if usernames_batch:  # Save usernames
+            await self.write("usernames", usernames_batch)
+
+        if nicknames_batch:  # Save user nicknames
+            await self.write("usernicks", nicknames_batch)
+
+        if roles_batch:  # Insert roles to reassign later.
+            await self.write(
+                "userroles",
+                [
+                    (user_id, server_id, roles)
+                    for server_id, data in roles_batch.items()
+                    for user_id, roles in data.items()
+                ],
+            )
+
+        if invite_batch:  # Insert invite data for basic tracking
+            await self.write("invites", invite_batch)
+
+        if voice_batch:
+            await self.write("voice", voice_batch)
+
+        if presence_batch:
+            await self.write("statuses", presence_batch)
+
+        elapsed = time.perf_counter() - start
+        partition.latency["bulk"] = elapsed
+        self.metrics.flushed("bulk_inserter", elapsed, waited)
 
     @commands.Cog.listener()
     @decorators.wait_until_ready()
     async def on_command(self, ctx):
         command = ctx.command.qualified_name
         self.bot.command_stats[command] += 1
+        partition = self.partition(ctx.guild, user_id=ctx.author.id)
         if ctx.guild:
             server_id = ctx.guild.id
+            key = (server_id, ctx.author.id, ctx.command.name, db.hour(time.time()))
+            partition.command_rollup[key] += 1
         else:
             server_id = None
-        async with self.batch_lock:
-            self.command_batch.append(
-                {
-                    "server": server_id,
-                    "channel": ctx.channel.id,
-                    "author": ctx.author.id,
-                    "timestamp": str(ctx.message.created_at.utcnow()),
-                    "prefix": ctx.prefix,
-                    "command": ctx.command.name,
-                    "failed": ctx.command_failed,
-                    "content": ctx.message.clean_content.replace("\u0000", ""),
-                }
+        partition.command_batch.append(
+            (
+                server_id,
+                ctx.channel.id,
+                ctx.author.id,
+                datetime.utcnow(),
+                ctx.prefix,
+                ctx.command.name,
+                ctx.command_failed,
+                ctx.message.clean_content.replace("\u0000", ""),
             )
+        )
 
     # Helper functions to detect changes
     @staticmethod
@@ -506,14 +867,13 @@ class Batch(commands.Cog):
             return
 
         if self.nickname_changed(before, after):
-            async with self.batch_lock:
-                self.nicknames_batch.append(
-                    {
-                        "user_id": after.id,
-                        "server_id": after.guild.id,
-                        "nickname": before.display_name.replace("\u0000", ""),
-                    }
+            self.partition(after.guild).nicknames_batch.append(
+                (
+                    after.id,
+                    after.guild.id,
+                    before.display_name.replace("\u0000", ""),
                 )
+            )
 
     @commands.Cog.listener()
     @decorators.wait_until_ready()
@@ -523,34 +883,27 @@ class Batch(commands.Cog):
             return
 
         if self.status_changed(before, after):
-            async with self.batch_lock:
-                self.status_batch[str(before.status)][after.id] = time.time()
-
-                lowest = discord.utils.find(
-                    lambda x: x.get_member(after.id) is not None,
-                    sorted(self.bot.guilds, key=lambda x: x.id),
+            # Presence updates fire once per mutual guild,
+            # only record the first one of each transition.
+            if self.presences.get(after.id) != after.status.name:
+                self.presences[after.id] = after.status.name
+                partition = self.partition(user_id=after.id)
+                partition.status_batch[after.id].append(
+                    (str(before.status), time.time())
                 )
-                if after.guild.id == lowest.id:
-                    self.presence_batch.append(
-                        {
-                            "user_id": after.id,
-                            "status": after.status.name,
-                            "first_seen": str(datetime.utcnow()),
-                        }
-                    )
-                status_txt = (
-                    f"updating their status: `{before.status}` ➔ `{after.status}`"
+                partition.presence_batch.append(
+                    (after.id, after.status.name, datetime.utcnow())
                 )
-                self.tracking_batch[before.id] = {time.time(): status_txt}
+            status_txt = f"updating their status: `{before.status}` ➔ `{after.status}`"
+            self.track(before.id, status_txt)
 
         if self.activity_changed(before, after):
             action = "updating their custom status"
-            async with self.batch_lock:
-                self.tracking_batch[before.id] = {time.time(): action}
+            self.track(before.id, action)
 
-                # self.activity_batch[before.id].update(
-                #     {str(before.activity): datetime.utcnow()}
-                # )
+            # self.activity_batch[before.id].update(
+            #     {str(before.activity): datetime.utcnow()}
+            # )
 
     @commands.Cog.listener()
     @decorators.wait_until_ready()
@@ -563,21 +916,14 @@ class Batch(commands.Cog):
         if after.id in self.whitelist:
             return
         if self.avatar_changed(before, after):
-            async with self.batch_lock:
-                self.tracking_batch[before.id] = {time.time(): "updating their avatar"}
-                self.bot.avatar_saver.save(after)
+            self.track(before.id, "updating their avatar")
+            self.bot.avatar_saver.save(after)
 
         if self.username_changed(before, after):
-            async with self.batch_lock:
-                self.usernames_batch.append(
-                    {
-                        "user_id": before.id,
-                        "name": str(before).replace("\u0000", ""),
-                    }
-                )
-                self.tracking_batch[before.id] = {
-                    time.time(): f"updating their username: `{before}` ➔ `{after}`"
-                }
+            self.partition(user_id=before.id).usernames_batch.append(
+                (before.id, str(before).replace("\u0000", ""))
+            )
+            self.track(before.id, f"updating their username: `{before}` ➔ `{after}`")
 
     @commands.Cog.listener()
     @decorators.wait_until_ready()
@@ -605,27 +951,34 @@ class Batch(commands.Cog):
         if message.author.id in self.whitelist:
             return
 
+        unix = message.created_at.timestamp()
+        partition = self.partition(message.guild)
         self.bot.message_stats[message.guild.id] += 1
-        async with self.batch_lock:
-            self.message_batch.append(
-                {
-                    "unix": message.created_at.timestamp(),
-                    "timestamp": str(message.created_at.utcnow()),
-                    "message_id": message.id,
-                    "author_id": message.author.id,
-                    "channel_id": message.channel.id,
-                    "server_id": message.guild.id,
-                }
+        partition.message_batch.append(
+            (
+                unix,
+                datetime.utcnow(),
+                message.id,
+                message.author.id,
+                message.channel.id,
+                message.guild.id,
             )
-            self.tracking_batch[message.author.id] = {time.time(): "sending a message"}
+        )
+        key = (message.guild.id, message.channel.id, message.author.id, db.hour(unix))
+        partition.message_rollup[key] += 1
+        partition.activity_days.add(
+            (message.guild.id, message.author.id, int(unix // 86400))
+        )
+        self.track(message.author.id, "sending a message")
+        self.last_spoke[message.author.id] = unix
+        self.server_last_spoke[(message.guild.id, message.author.id)] = unix
 
         matches = EMOJI_REGEX.findall(message.content)
         if matches:
-            async with self.batch_lock:
-                counter = Counter(map(int, matches))
-                self.emote_batch[message.guild.id].update({message.author.id: counter})
+            counter = Counter(map(int, matches))
+            partition.emote_batch[message.guild.id].update({message.author.id: counter})
 
-                # self.emoji_batch[message.guild.id].update(map(int, matches))
+            # self.emoji_batch[message.guild.id].update(map(int, matches))
 
     @commands.Cog.listener()
     @decorators.wait_until_ready()
@@ -633,8 +986,7 @@ class Batch(commands.Cog):
     async def on_typing(self, channel, user, when):
         if user.id in self.whitelist:
             return
-        async with self.batch_lock:
-            self.tracking_batch[user.id] = {time.time(): "typing"}
+        self.track(user.id, "typing")
 
     @commands.Cog.listener()
     @decorators.wait_until_ready()
@@ -650,8 +1002,7 @@ class Batch(commands.Cog):
             return
         if message.author.id in self.whitelist:
             return
-        async with self.batch_lock:
-            self.tracking_batch[message.author.id] = {time.time(): "editing a message"}
+        self.track(message.author.id, "editing a message")
 
     @commands.Cog.listener()
     @decorators.wait_until_ready()
@@ -663,10 +1014,7 @@ class Batch(commands.Cog):
             return
         if user.bot:
             return
-        async with self.batch_lock:
-            self.tracking_batch[payload.user_id] = {
-                time.time(): "reacting to a message"
-            }
+        self.track(payload.user_id, "reacting to a message")
 
     @commands.Cog.listener()
     @decorators.wait_until_ready()
@@ -675,31 +1023,18 @@ class Batch(commands.Cog):
         if member.id in self.whitelist:
             return
 
-        async with self.batch_lock:
-            self.tracking_batch[member.id] = {time.time(): "changing their voice state"}
+        self.track(member.id, "changing their voice state")
 
         if before.channel and not after.channel:
             # User left a voice channel.
-            async with self.batch_lock:
-                self.voice_batch.append(
-                    {
-                        "server_id": member.guild.id,
-                        "user_id": member.id,
-                        "connected": False,
-                        "first_seen": str(datetime.utcnow()),
-                    }
-                )
+            self.partition(member.guild).voice_batch.append(
+                (member.guild.id, member.id, False, datetime.utcnow())
+            )
         if not before.channel and after.channel:
             # User joined a voice channel.
-            async with self.batch_lock:
-                self.voice_batch.append(
-                    {
-                        "server_id": member.guild.id,
-                        "user_id": member.id,
-                        "connected": True,
-                        "first_seen": str(datetime.utcnow()),
-                    }
-                )
+            self.partition(member.guild).voice_batch.append(
+                (member.guild.id, member.id, True, datetime.utcnow())
+            )
 
     @commands.Cog.listener()
     @decorators.wait_until_ready()
@@ -708,18 +1043,13 @@ class Batch(commands.Cog):
         if invite.inviter.id in self.whitelist:
             return
 
-        async with self.batch_lock:
-            self.tracking_batch[invite.inviter.id] = {time.time(): "creating an invite"}
-        if not invite.guild.me.guild_permissions.manage_guild:
-            return
-        self.bot.invites[invite.guild.id] = await invite.guild.invites()
+        self.track(invite.inviter.id, "creating an invite")
+        self.bot.invites.add(invite)
 
     @commands.Cog.listener()
     @decorators.wait_until_ready()
     async def on_invite_delete(self, invite):
-        if not invite.guild.me.guild_permissions.manage_guild:
-            return
-        self.bot.invites[invite.guild.id] = await invite.guild.invites()
+        self.bot.invites.remove(invite)
 
     @commands.Cog.listener()
     @decorators.wait_until_ready()
@@ -728,53 +1058,22 @@ class Batch(commands.Cog):
         if member.id in self.whitelist:
             return
 
-        async with self.batch_lock:
-            self.tracking_batch[member.id] = {time.time(): "joining a server"}
-
-        await asyncio.sleep(2)  # API rest.
-
-        try:
-            if not member.guild.me.guild_permissions.manage_guild:
-                return
-        except AttributeError:  # Sometimes if we're getting kicked as they join...
-            return
-        async with self.batch_lock:
-            old_invites = self.bot.invites[member.guild.id]
-            new_invites = await member.guild.invites()
-            for invite in old_invites:
-                if not self.get_invite(new_invites, invite.code):
-                    continue
-                if invite.uses < self.get_invite(new_invites, invite.code).uses:
-                    self.invite_batch.append(
-                        {
-                            "invitee": member.id,
-                            "inviter": invite.inviter.id,
-                            "server_id": member.guild.id,
-                        }
-                    )
-            self.bot.invites[member.guild.id] = new_invites
-
-    def get_invite(self, invite_list, code):
-        for invite in invite_list:
-            if invite.code == code:
-                return invite
+        self.track(member.id, "joining a server")
+        # invite_tracker works out which invite they used.
+        self.invite_joins[member.guild.id].append(member.id)
 
     @commands.Cog.listener()
     @decorators.wait_until_ready()
     @decorators.event_check(lambda s, m: not m.bot)
     async def on_member_remove(self, member):
-        async with self.batch_lock:
-
-            roles = ",".join([str(x.id) for x in member.roles if x.name != "@everyone"])
-            self.roles_batch[member.guild.id].update({member.id: roles})
-
-            if member.id in self.whitelist:
-                return
-            self.tracking_batch[member.id] = {time.time(): "leaving a server"}
+        roles = ",".join([str(x.id) for x in member.roles if x.name != "@everyone"])
+        self.partition(member.guild).roles_batch[member.guild.id].update(
+            {member.id: roles}
+        )
 
-        if not member.guild.me.guild_permissions.manage_guild:
+        if member.id in self.whitelist:
             return
-        self.bot.invites[member.guild.id] = await member.guild.invites()
+        self.track(member.id, "leaving a server")
 
     '''
     @commands.Cog.listener()
@@ -818,15 +1117,28 @@ class Batch(commands.Cog):
     async def on_reaction_remove(self, reaction, user):
         self.bot.dispatch("picklist_reaction", reaction, user)
 
-    async def last_observed(self, member):
-        """Lookup last_observed data."""
+    async def fetch_last_seen(self, user_id):
+        """
+        Get a user's (unix, action) from memory,
+        falling back to the tracker table on a miss.
+        """
+        data = self.last_seen.get(user_id)
+        if data:
+            return data
         query = """
                 SELECT DISTINCT ON (unix) unix, action
                 FROM tracker
                 WHERE user_id = $1
                 ORDER BY unix DESC;
                 """
-        last_seen_data = await self.bot.cxn.fetchrow(query, member.id) or None
+        row = await self.bot.cxn.fetchrow(query, user_id)
+        if row:
+            data = self.last_seen[user_id] = (row["unix"], row["action"])
+        return data
+
+    async def last_observed(self, member):
+        """Lookup last_observed data."""
+        last_seen_data = await self.fetch_last_seen(member.id)
 
         last_spoke = await self.get_last_spoke(member)
         server_last_spoke = await self.get_server_last_spoke(member)
@@ -890,47 +1202,42 @@ class Batch(commands.Cog):
         Get when a user last performed
         an action across all of discord.
         """
-        query = """
-                SELECT DISTINCT ON (unix) unix, action
-                FROM tracker
-                WHERE user_id = $1
-                ORDER BY unix DESC;
-                """
-        data = await self.bot.cxn.fetchrow(query, user.id)
+        data = await self.fetch_last_seen(user.id)
         if not data:
             return
-        last_seen = utils.time_between(int(data["unix"]), int(time.time())) + " ago."
-        # last_seen = utils.format_relative(int(data["unix"]))
+        unix, action = data
+        last_seen = utils.time_between(int(unix), int(time.time())) + " ago."
+        # last_seen = utils.format_relative(int(unix))
         if raw:
             return last_seen
 
-        if data["action"]:
-            msg = f"User **{user}** `{user.id}` was last seen {data['action']} **{last_seen}**"
+        if action:
+            msg = f"User **{user}** `{user.id}` was last seen {action} **{last_seen}**"
         else:
             msg = f"User **{user}** `{user.id}` was last seen **{last_seen}**"
 
         return msg
 
     async def get_last_spoke(self, user):
-        query = """
-                SELECT MAX(unix)
-                FROM messages
-                WHERE author_id = $1;
-                """
-        last_spoke = await self.bot.cxn.fetchval(query, user.id)
+        last_spoke = self.last_spoke.get(user.id)
+        if not last_spoke:
+            last_spoke = await self.bot.cxn.fetchval(queries.LAST_SPOKE, user.id)
+            if last_spoke:
+                self.last_spoke[user.id] = last_spoke
         if last_spoke:
             return utils.time_between(int(last_spoke), int(time.time()))
 
     async def get_server_last_spoke(self, user):
         if not hasattr(user, "guild"):
             return
-        query = """
-                SELECT MAX(unix)
-                FROM messages
-                WHERE author_id = $1
-                AND server_id = $2;
-                """
-        server_spoke = await self.bot.cxn.fetchval(query, user.id, user.guild.id)
+        key = (user.guild.id, user.id)
+        server_spoke = self.server_last_spoke.get(key)
+        if not server_spoke:
+            server_spoke = await self.bot.cxn.fetchval(
+                queries.SERVER_LAST_SPOKE, user.id, user.guild.id
+            )
+            if server_spoke:
+                self.server_last_spoke[key] = server_spoke
         if server_spoke:
             return utils.time_between(int(server_spoke), int(time.time()))
 
@@ -939,12 +1246,9 @@ class Batch(commands.Cog):
         Gets the number of messages
         sent by the user across discord.
         """
-        query = """
-                SELECT COUNT(*)
-                FROM messages
-                WHERE author_id = $1
-                """
-        return await self.bot.cxn.fetchval(query, user.id)
+        return await self.bot.analytics_cxn.fetchval(
+            queries.USER_MESSAGE_COUNT, user.id
+        )
 
     async def get_server_message_count(self, user):
         """
@@ -954,25 +1258,18 @@ class Batch(commands.Cog):
         if not hasattr(user, "guild"):
             return 0
 
-        query = """
-                SELECT COUNT(*)
-                FROM messages
-                WHERE author_id = $1
-                AND server_id = $2
-                """
-        return await self.bot.cxn.fetchval(query, user.id, user.guild.id)
+        return await self.bot.analytics_cxn.fetchval(
+            queries.MESSAGE_COUNT, user.id, user.guild.id
+        )
 
     async def get_command_count(self, user):
         """
         Gets the number of commands run
         by the user across discord.
         """
-        query = """
-                SELECT COUNT(*)
-                FROM commands
-                WHERE author_id = $1
-                """
-        return await self.bot.cxn.fetchval(query, user.id)
+        return await self.bot.analytics_cxn.fetchval(
+            queries.USER_COMMAND_COUNT, user.id
+        )
 
     async def get_server_command_count(self, user):
         """
@@ -982,13 +1279,9 @@ class Batch(commands.Cog):
         if not hasattr(user, "guild"):
             return 0
 
-        query = """
-                SELECT COUNT(*)
-                FROM commands
-                WHERE author_id = $1
-                AND server_id = $2
-                """
-        return await self.bot.cxn.fetchval(query, user.id, user.guild.id)
+        return await self.bot.analytics_cxn.fetchval(
+            queries.COMMAND_COUNT, user.id, user.guild.id
+        )
 
     async def get_activities(self, user):
         """
@@ -1158,7 +1158,8 @@ class Botadmin(commands.Cog):
             await ctx.send_or_reply(e)
 
     async def tabulate_query(self, ctx, query, *args):
-        records = await self.bot.cxn.fetch(query, *args)
+        # The command history scans commands, too slow for the interactive pool.
+        records = await self.bot.analytics_cxn.fetch(query, *args)
 
         if len(records) == 0:
             return await ctx.send_or_reply(content="No results found.")
@@ -1286,7 +1287,9 @@ class Botadmin(commands.Cog):
 
         all_commands = {c.qualified_name: 0 for c in self.bot.walk_commands()}
 
-        records = await self.bot.cxn.fetch(query, datetime.timedelta(days=days))
+        records = await self.bot.analytics_cxn.fetch(
+            query, datetime.timedelta(days=days)
+        )
         for name, uses in records:
             if name in all_commands:
                 all_commands[name] = uses
@@ -1374,7 +1377,7 @@ class Botadmin(commands.Cog):
                 self.total += record["total"]
 
         data = defaultdict(Count)
-        records = await self.bot.cxn.fetch(query, interval)
+        records = await self.bot.analytics_cxn.fetch(query, interval)
         for record in records:
             command = self.bot.get_command(record["command"])
             if command is None or command.cog is None:
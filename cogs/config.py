@@ -4,9 +4,9 @@ import asyncpg
 import discord
 import itertools
 
-from collections import defaultdict
 from discord.ext import commands
 
+from utilities import cache
 from utilities import checks
 from utilities import helpers
 from utilities import converters
@@ -29,8 +29,8 @@ class Config(commands.Cog):
         bot.loop.create_task(self.load_command_config())
 
         self.bot = bot
-        self.ignored = defaultdict(list)  # List of ignored entities
-        self.command_config = defaultdict(list)  # list of ignored commands
+        # Ignored entities and disabled commands, also read by checks.is_disabled
+        self.index = cache.PermissionIndex()
 
     async def load_command_config(self):
         query = """
@@ -38,11 +38,7 @@ class Config(commands.Cog):
                 FROM command_config GROUP BY entity_id;
                 """
         records = await self.bot.cxn.fetch(query)
-        if records:
-            [
-                self.command_config[record["entity_id"]].extend(record["commands"])
-                for record in records
-            ]
+        self.index.load_disabled(records)
 
     async def load_plonks(self):
         query = """
@@ -50,11 +46,7 @@ class Config(commands.Cog):
                 FROM plonks GROUP BY server_id;
                 """
         records = await self.bot.cxn.fetch(query)
-        if records:
-            [
-                self.ignored[record["server_id"]].extend(record["entities"])
-                for record in records
-            ]
+        self.index.load_ignored(records)
 
     async def bot_check_once(self, ctx):
         # Reasons for bypassing
@@ -69,21 +61,12 @@ class Config(commands.Cog):
                 return True  # Manage guild is immune.
 
         # Now check channels, roles, and users.
-        if ctx.channel.id in self.ignored[ctx.guild.id]:
-            return False  # Channel is ignored.
-
-        if ctx.author.id in self.ignored[ctx.guild.id]:
-            return False  # User is ignored.
-
-        if any(
-            (
-                role_id in self.ignored[ctx.guild.id]
-                for role_id in [r.id for r in ctx.author.roles]
-            )
-        ):
-            return False  # Role is ignored.
-
-        return True  # Ok just in case we get here...
+        return not self.index.is_ignored(
+            ctx.guild.id,
+            ctx.channel.id,
+            ctx.author.id,
+            getattr(ctx.author, "_roles", ()),
+        )
 
     async def bot_check(self, ctx):
         if ctx.guild is None:
@@ -96,24 +79,14 @@ class Config(commands.Cog):
             if ctx.author.guild_permissions.manage_guild:
                 return True  # Manage guild is immune.
 
-        if str(ctx.command) in self.command_config[ctx.guild.id]:
-            return False  # Disabled for the whole server.
-
-        if str(ctx.command) in self.command_config[ctx.channel.id]:
-            return False  # Disabled for the channel
-
-        if str(ctx.command) in self.command_config[ctx.author.id]:
-            return False  # Disabled for the user
-
-        if any(
-            (
-                str(ctx.command) in self.command_config[role_id]
-                for role_id in ctx.author._roles
-            )
-        ):
-            return False  # Disabled for the role
-
-        return True  # Ok just in case we get here...
+        # Disabled for the server, the channel, the user or one of their roles.
+        return not self.index.is_disabled(
+            str(ctx.command),
+            ctx.guild.id,
+            ctx.channel.id,
+            ctx.author.id,
+            getattr(ctx.author, "_roles", ()),
+        )
 
     async def ignore_entities(self, ctx, entities):
         failed = []
@@ -135,7 +108,7 @@ class Config(commands.Cog):
                         continue
                     else:
                         success.append(str(entity))
-                        self.ignored[ctx.guild.id].append(entity.id)
+                        self.index.ignore(ctx.guild.id, entity.id)
         if success:
             await ctx.success(
                 f"Ignored entit{'y' if len(success) == 1 else 'ies'} `{', '.join(success)}`"
@@ -288,7 +261,7 @@ class Config(commands.Cog):
         await ctx.trigger_typing()
         query = "DELETE FROM plonks WHERE server_id = $1;"
         await self.bot.cxn.execute(query, ctx.guild.id)
-        self.ignored[ctx.guild.id].clear()
+        self.index.clear_ignored(ctx.guild.id)
         await ctx.success("Cleared the server's ignore list.")
 
     @decorators.group(
@@ -326,9 +299,7 @@ class Config(commands.Cog):
                 """
         entries = [c.id for c in entities]
         await self.bot.cxn.execute(query, ctx.guild.id, entries)
-        self.ignored[ctx.guild.id] = [
-            x for x in self.ignored[ctx.guild.id] if x not in entries
-        ]
+        self.index.unignore(ctx.guild.id, *entries)
         await ctx.success(
             f"Removed `{', '.join([str(x) for x in entities])}` from the ignored list."
         )
@@ -377,7 +348,7 @@ class Config(commands.Cog):
                         continue
                     else:
                         success.append(command)
-                        self.command_config[entity.id].append(command)
+                        self.index.disable(entity.id, command)
         if success:
             await ctx.success(
                 f"Disabled command{'' if len(success) == 1 else 's'} `{', '.join(success)}` for entity `{entity}`"
@@ -393,9 +364,7 @@ class Config(commands.Cog):
                 AND command = ANY($3::TEXT[]);
                 """
         await self.bot.cxn.execute(query, ctx.guild.id, entity.id, commands)
-        self.command_config[entity.id] = [
-            x for x in self.command_config[entity.id] if x not in commands
-        ]
+        self.index.enable(entity.id, *commands)
         await ctx.success(
             f"Enabled commands `{', '.join(commands)}` for entity `{entity}`"
         )
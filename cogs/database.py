@@ -1,4 +1,6 @@
 import io
+import copy
+import json
 import time
 import asyncio
 import asyncpg
@@ -6,8 +8,13 @@ import discord
 import traceback
 import subprocess
 
+from datetime import datetime
 from discord.ext import commands
 
+from utilities import db
+from utilities import migrations
+from utilities import pools
+from utilities import queries
 from utilities import utils
 from utilities import checks
 from utilities import decorators
@@ -16,6 +23,16 @@ from utilities import pagination
 from utilities import formatting
 
 
+def seq_scans(plan):
+    """
+    Yield the relations a JSON query plan reads with a sequential scan.
+    """
+    if plan.get("Node Type") == "Seq Scan":
+        yield plan.get("Relation Name")
+    for child in plan.get("Plans", ()):
+        yield from seq_scans(child)
+
+
 async def setup(bot):
     await bot.add_cog(Database(bot))
 
@@ -46,8 +63,10 @@ class Database(commands.Cog):
         """
         if await ctx.confirm("This action will restart my database."):
 
-            members = [x for x in self.bot.get_all_members()]
-            await self.bot.database.initialize(self.bot, members)
+            await self.bot.database.initialize(self.bot)
+            await self.bot.database.sync_members(
+                {member.id for member in self.bot.get_all_members()}
+            )
             await ctx.success("**Updated database**")
 
     @decorators.command(
@@ -67,11 +86,34 @@ class Database(commands.Cog):
             server = ctx.guild
         c = await ctx.confirm("This action will purge all this server's data.")
         if c:
-            msg = await ctx.load("Recursively discarding all server data...")
-
             await self.bot.database.destroy_server(server.id)
+            await ctx.success(
+                f"Queued all server data for deletion. Use `{ctx.prefix}erasures` to follow its progress."
+            )
+
+    @decorators.command(
+        aliases=["discrepancies"],
+        brief="Purge data on servers the bot left.",
+    )
+    async def orphans(self, ctx):
+        """
+        Usage: {0}orphans
+        Alias: {0}discrepancies
+        Permission: Bot owner
+        Output:
+            Deletes every row of servers the
+            bot is no longer in and shows how
+            many rows each table lost.
+        """
+        c = await ctx.confirm("This action will purge the data of every server I left.")
+        if c:
+            msg = await ctx.load("Purging data on servers I am no longer in...")
+            counts = await self.bot.database.purge_discrepancies(self.bot.guilds)
+            table = formatting.TabularData()
+            table.set_columns(["TABLE", "ROWS"])
+            table.add_rows(counts.items())
             await msg.edit(
-                content=f"**{self.bot.emote_dict['delete']} Successfully discarded all server data.**"
+                content=f"Purged {sum(counts.values())} row(s).```sml\n{table.render()}```"
             )
 
     # Thank you R. Danny
@@ -97,16 +139,18 @@ class Database(commands.Cog):
         query = utils.cleanup_code(query)
 
         is_multistatement = query.count(";") > 1
-        if is_multistatement:
-            # fetch does not support multiple statements
-            strategy = self.bot.cxn.execute
-        else:
-            strategy = self.bot.cxn.fetch
-
         try:
-            start = time.perf_counter()
-            results = await strategy(query)
-            dt = (time.perf_counter() - start) * 1000.0
+            # Owner queries may run as long as they need.
+            async with pools.unbounded(self.bot.cxn) as conn:
+                if is_multistatement:
+                    # fetch does not support multiple statements
+                    strategy = conn.execute
+                else:
+                    strategy = conn.fetch
+
+                start = time.perf_counter()
+                results = await strategy(query)
+                dt = (time.perf_counter() - start) * 1000.0
         except Exception:
             return await ctx.send_or_reply(
                 content=f"```py\n{traceback.format_exc()}\n```",
@@ -402,6 +446,315 @@ class Database(commands.Cog):
         else:
             await ctx.send_or_reply(content=fmt)
 
+    @decorators.command(brief="Toggle COPY batch inserts.")
+    async def copymode(self, ctx):
+        """
+        Usage: {0}copymode
+        Permission: Bot owner
+        Output:
+            Switches the batch cog between COPY
+            and the JSONB fallback for bulk inserts.
+        """
+        batch = self.bot.get_cog("Batch")
+        if not batch:
+            return await ctx.fail("The batch cog is not loaded.")
+        batch.copy_mode = not batch.copy_mode
+        mode = "COPY" if batch.copy_mode else "JSONB"
+        await ctx.success(f"Batch inserts now use **{mode}**.")
+
+    @decorators.command(aliases=["migrations"], brief="Show schema migrations.")
+    async def migrate(self, ctx):
+        """
+        Usage: {0}migrate
+        Alias: {0}migrations
+        Permission: Bot owner
+        Output:
+            Applies any pending migrations in
+            ./data/migrations and shows the
+            version history of the schema.
+        """
+        try:
+            done = await migrations.migrate(self.bot.cxn)
+        except migrations.MigrationError as e:
+            return await ctx.fail(str(e))
+
+        records = await migrations.applied(self.bot.cxn)
+        table = formatting.TabularData()
+        table.set_columns(["VERSION", "NAME", "APPLIED", "SECONDS"])
+        table.add_rows(
+            [
+                record["version"],
+                record["name"],
+                record["applied_at"].strftime("%Y-%m-%d %H:%M"),
+                f"{record['duration']:.2f}",
+            ]
+            for record in sorted(records.values(), key=lambda r: r["version"])
+        )
+        await ctx.send_or_reply(
+            f"Applied {len(done)} pending migration(s).```sml\n{table.render()}```"
+        )
+
+    @decorators.command(aliases=["saturation"], brief="Show connection pool usage.")
+    async def pools(self, ctx):
+        """
+        Usage: {0}pools
+        Alias: {0}saturation
+        Permission: Bot owner
+        Output:
+            Shows how many connections each
+            workload's pool has checked out
+            out of its maximum size.
+        """
+        table = formatting.TabularData()
+        table.set_columns(["POOL", "BUSY", "SIZE", "MAX", "SATURATION"])
+        table.add_rows(
+            [
+                name,
+                usage["busy"],
+                usage["size"],
+                usage["max"],
+                f"{usage['saturation']:.0%}",
+            ]
+            for name, usage in pools.saturation(self.bot.pools).items()
+        )
+        await ctx.send_or_reply(f"```sml\n{table.render()}```")
+
+    @decorators.command(aliases=["erasing"], brief="Show pending data erasures.")
+    async def erasures(self, ctx):
+        """
+        Usage: {0}erasures
+        Alias: {0}erasing
+        Permission: Bot owner
+        Output:
+            Shows the queued opt out and server
+            removal deletes, the table each one
+            is on and how many rows it has deleted.
+        """
+        jobs = await db.pending_erasures(self.bot.cxn)
+        if not jobs:
+            return await ctx.success("No erasures are pending.")
+
+        table = formatting.TabularData()
+        table.set_columns(["KIND", "TARGET", "STEP", "TABLE", "DELETED", "QUEUED"])
+        table.add_rows(
+            [
+                job["kind"],
+                job["target"],
+                f"{job['step'] + 1}/{len(db.ERASURES[job['kind']])}",
+                db.ERASURES[job["kind"]][job["step"]][0],
+                job["deleted"],
+                job["created"].strftime("%Y-%m-%d %H:%M"),
+            ]
+            for job in jobs
+        )
+        await ctx.send_or_reply(f"```sml\n{table.render()}```")
+
+    @decorators.group(
+        aliases=["bench"],
+        case_insensitive=True,
+        invoke_without_command=True,
+        brief="Benchmark database operations.",
+    )
+    async def benchmark(self, ctx):
+        """
+        Usage: {0}benchmark <option>
+        Alias: {0}bench
+        Output: Times database operations against temporary tables.
+        Options:
+            ingest: Compare COPY and JSONB batch inserts
+            tracker: Compare last seen flush strategies
+            plans: Check analytics queries for sequential scans
+        """
+        if ctx.invoked_subcommand is None:
+            return await ctx.usage("<option>")
+
+    @benchmark.command(brief="Check analytics queries for sequential scans.")
+    @commands.guild_only()
+    async def plans(self, ctx):
+        """
+        Usage: {0}benchmark plans
+        Output:
+            Runs EXPLAIN on every analytics query with
+            sequential scans disabled and lists any that
+            still scan an activity table, meaning no
+            index can serve that access path.
+        """
+        params = {
+            "author": ctx.author.id,
+            "server": ctx.guild.id,
+            "channel": ctx.channel.id,
+            "hour": db.hour(time.time() - 2592000),  # 30 days ago
+            "day": int(time.time() // 86400),
+            "limit": 100,
+        }
+        results = []
+        async with self.bot.analytics_cxn.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute("SET LOCAL enable_seqscan = off;")
+                for name, (query, args) in queries.ANALYTICS.items():
+                    plan = await conn.fetchval(
+                        f"EXPLAIN (FORMAT JSON) {query}", *(params[x] for x in args)
+                    )
+                    plan = json.loads(plan)[0]["Plan"]  # asyncpg returns json as text
+                    scans = {
+                        x
+                        for x in seq_scans(plan)
+                        if x.startswith(("message", "command", "activity"))
+                    }
+                    results.append(
+                        (name, ", ".join(sorted(scans)) or "none", plan["Total Cost"])
+                    )
+
+        failed = sum(row[1] != "none" for row in results)
+        table = formatting.TabularData()
+        table.set_columns(["query", "seq scans", "cost"])
+        table.add_rows(results)
+        render = table.render()
+        await ctx.send_or_reply(
+            content=f"```sml\n{render}\n```\n*{failed} of {len(results)} queries fall back to a sequential scan*"
+        )
+
+    @benchmark.command(brief="Measure message throughput through get_context.")
+    async def context(self, ctx, messages: int = 10000):
+        """
+        Usage: {0}benchmark context [messages]
+        Output:
+            Runs copies of your message through get_context
+            as plain chatter and as a command, then times the
+            old list based prefix check against the compiled
+            prefix matcher on its own.
+        """
+        prefix = self.bot.get_guild_prefixes(ctx.guild)[-1]
+        samples = {
+            "chatter": "did anyone see the game last night",
+            "command": f"{prefix}ping",
+        }
+        message = copy.copy(ctx.message)
+        results = []
+        for name, content in samples.items():
+            message.content = content
+            start = time.perf_counter()
+            for _ in range(messages):
+                await self.bot.get_context(message)
+            dt = time.perf_counter() - start
+            results.append(
+                (f"context {name}", f"{dt * 1000.0:.2f}ms", f"{messages / dt:,.0f}")
+            )
+
+            start = time.perf_counter()
+            for _ in range(messages):
+                content.startswith(tuple(self.bot.command_prefix(self.bot, message)))
+            dt = time.perf_counter() - start
+            results.append(
+                (f"list {name}", f"{dt * 1000.0:.2f}ms", f"{messages / dt:,.0f}")
+            )
+
+            start = time.perf_counter()
+            for _ in range(messages):
+                self.bot.prefix_matcher(message.guild).match(content)
+            dt = time.perf_counter() - start
+            results.append(
+                (f"matcher {name}", f"{dt * 1000.0:.2f}ms", f"{messages / dt:,.0f}")
+            )
+
+        table = formatting.TabularData()
+        table.set_columns(["path", "time", "messages/sec"])
+        table.add_rows(results)
+        render = table.render()
+        await ctx.send_or_reply(
+            content=f"```sml\n{render}\n```\n*Ran {formatting.plural(messages):message} per path*"
+        )
+
+    @benchmark.command(brief="Compare COPY and JSONB batch inserts.")
+    async def ingest(self, ctx, rows: int = 10000):
+        """
+        Usage: {0}benchmark ingest [rows]
+        Output:
+            Writes the same synthetic message rows
+            with both batch writers and shows rows/sec.
+        """
+        now = datetime.utcnow()
+        server_id = ctx.guild.id if ctx.guild else None
+        records = [
+            (now.timestamp(), now, index, ctx.author.id, ctx.channel.id, server_id)
+            for index in range(rows)
+        ]
+        layout = ", ".join(
+            f"{column} {kind}" for column, kind in db.LAYOUTS["messages"]
+        )
+        query = f"CREATE TEMP TABLE bench_messages ({layout}) ON COMMIT DROP;"
+
+        results = []
+        async with pools.unbounded(self.bot.cxn) as conn:
+            async with conn.transaction():
+                await conn.execute(query)
+                for name, writer in (
+                    ("COPY", db.copy_records),
+                    ("JSONB", db.jsonb_records),
+                ):
+                    start = time.perf_counter()
+                    await writer(conn, "messages", records, target="bench_messages")
+                    dt = time.perf_counter() - start
+                    results.append((name, f"{dt * 1000.0:.2f}ms", f"{rows / dt:,.0f}"))
+
+        table = formatting.TabularData()
+        table.set_columns(["writer", "time", "rows/sec"])
+        table.add_rows(results)
+        render = table.render()
+        await ctx.send_or_reply(
+            content=f"```sml\n{render}\n```\n*Inserted {formatting.plural(rows):row} per writer*"
+        )
+
+    @benchmark.command(brief="Compare last seen flush strategies.")
+    async def tracker(self, ctx, users: int = 10000):
+        """
+        Usage: {0}benchmark tracker [users]
+        Output:
+            Times the per row executemany flush against
+            the set based upsert for growing user counts.
+        """
+        old_query = """
+                    INSERT INTO bench_tracker (user_id, unix, action)
+                    VALUES ($1, $2, $3)
+                    ON CONFLICT (user_id)
+                    DO UPDATE SET unix = $2, action = $3
+                    WHERE bench_tracker.user_id = $1;
+                    """
+        sizes = [10**power for power in range(1, 7) if 10**power < users]
+        sizes.append(users)
+
+        results = []
+        async with pools.unbounded(self.bot.cxn) as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    "CREATE TEMP TABLE bench_tracker (LIKE tracker INCLUDING ALL) ON COMMIT DROP;"
+                )
+                for size in sizes:
+                    rows = [
+                        (index, time.time(), "benchmarking") for index in range(size)
+                    ]
+                    # Seed the table so both strategies hit the conflict path.
+                    await conn.execute("TRUNCATE bench_tracker;")
+                    await db.upsert_last_seen(conn, rows, target="bench_tracker")
+
+                    start = time.perf_counter()
+                    await conn.executemany(old_query, rows)
+                    executemany = (time.perf_counter() - start) * 1000.0
+
+                    start = time.perf_counter()
+                    await db.upsert_last_seen(conn, rows, target="bench_tracker")
+                    unnest = (time.perf_counter() - start) * 1000.0
+
+                    results.append(
+                        (f"{size:,}", f"{executemany:.2f}ms", f"{unnest:.2f}ms")
+                    )
+
+        table = formatting.TabularData()
+        table.set_columns(["users", "executemany", "unnest"])
+        table.add_rows(results)
+        render = table.render()
+        await ctx.send_or_reply(content=f"```sml\n{render}\n```")
+
     async def run_process(self, command):
         try:
             process = await asyncio.create_subprocess_shell(
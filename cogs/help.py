@@ -807,7 +807,7 @@ class Help(commands.Cog):
                 FROM commands
                 WHERE command = $1
                 """
-        stats = await self.bot.cxn.fetchval(query, command.qualified_name)
+        stats = await self.bot.analytics_cxn.fetchval(query, command.qualified_name)
         last_run = utils.format_time(stats[1])
         total_runs = stats[0]
         title = f"{self.bot.emote_dict['commands']} **Information on `{command.qualified_name}`**"
@@ -64,12 +64,12 @@ class Info(commands.Cog):
 
     async def total_global_commands(self):
         query = """SELECT COUNT(*) FROM commands"""
-        value = await self.bot.cxn.fetchval(query)
+        value = await self.bot.analytics_cxn.fetchval(query)
         return value
 
     async def total_global_messages(self):
         query = """SELECT COUNT(*) FROM messages"""
-        value = await self.bot.cxn.fetchval(query)
+        value = await self.bot.analytics_cxn.fetchval(query)
         return value
 
     async def get_version(self):
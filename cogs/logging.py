@@ -6,10 +6,11 @@ import codecs
 import discord
 
 from collections import defaultdict, Counter
-from discord.ext import commands, menus, tasks
+from discord.ext import commands, menus
 from datetime import timedelta
 
-from utilities import utils
+from utilities import cache
+from utilities import webhooks
 from utilities import checks
 from utilities import converters
 from utilities import decorators
@@ -22,6 +23,13 @@ CREATED_MESSAGE = "https://cdn.discordapp.com/attachments/846597178918436885/846
 UPDATED_MESSAGE = "https://cdn.discordapp.com/attachments/846597178918436885/846841668639653939/messageupdate.png"
 DELETED_MESSAGE = "https://cdn.discordapp.com/attachments/846597178918436885/846841722994163722/messagedelete.png"
 
+# Snipes kept per channel, and how many seconds they are kept for.
+SNIPE_SIZE = 10
+SNIPE_TTL = 3600
+# Upper bounds on the channels and (channel, author) pairs tracked.
+SNIPE_CHANNELS = 5000
+SNIPE_AUTHORS = 20000
+
 
 async def setup(bot):
     await bot.add_cog(Logging(bot))
@@ -37,7 +45,7 @@ class Logging(commands.Cog):
         self.entities = defaultdict(list)
         self.log_data = defaultdict(dict)
         self.settings = defaultdict(dict)
-        self.tasks = defaultdict(list)
+        self.dispatcher = webhooks.Dispatcher(bot)
         self.webhooks = defaultdict(discord.Webhook)
 
         bot.loop.create_task(self.load_settings())
@@ -59,19 +67,21 @@ class Logging(commands.Cog):
             "voice",
         ]  # Helper list with all our logging types.
 
-        # self.dispatch_webhooks.add_exception_type(discord.NotFound)
-        self.dispatch_webhooks.start()  # Start the task loop
-
         self.map = {
             True: bot.emote_dict["pass"],
             False: bot.emote_dict["fail"],
         }  # Map for determining the emote.
 
-        self.snipes = []
-        self.edited = []
+        # Recently deleted and edited messages for snipe and editsnipe.
+        self.snipes = cache.SnipeStore(
+            SNIPE_SIZE, SNIPE_TTL, channels=SNIPE_CHANNELS, authors=SNIPE_AUTHORS
+        )
+        self.edited = cache.SnipeStore(
+            SNIPE_SIZE, SNIPE_TTL, channels=SNIPE_CHANNELS, authors=SNIPE_AUTHORS
+        )
 
-    def cog_unload(self):  # Stop the task loop
-        self.dispatch_webhooks.stop()
+    def cog_unload(self):  # Stop the webhook workers
+        self.dispatcher.close()
 
     async def load_settings(self):
         query = """
@@ -188,9 +198,9 @@ class Logging(commands.Cog):
 
     async def send_webhook(self, webhook, *, embed=None, file=None):
         if embed:
-            self.tasks[webhook].append(embed)
+            self.dispatcher.send(webhook, embed)
         if file:
-            self.tasks[webhook].append(file)
+            self.dispatcher.send(webhook, file)
 
     # Helper function to truncate oversized strings.
     def truncate(self, string, max_chars):
@@ -200,37 +210,6 @@ class Logging(commands.Cog):
     def is_ignored(self, guild, objects):
         return any([obj in self.entities[guild.id] for obj in objects])
 
-    @tasks.loop(seconds=3.0)
-    async def dispatch_webhooks(self):
-        if self.tasks:
-            for webhook, objects in self.tasks.items():
-                if objects:
-                    to_send = objects[:10]
-                    embeds = [x for x in to_send if type(x) is discord.Embed]
-                    files = [x for x in to_send if type(x) is discord.File]
-                    try:
-                        await webhook.send(
-                            embeds=embeds,
-                            files=files,
-                            username=f"{self.bot.user.name}-logger",
-                            avatar_url=self.bot.user.display_avatar.url,
-                        )
-                    except discord.NotFound:  # Raised when users manually delete the webhook.
-                        pass
-                    except discord.HTTPException:  # Embed too large
-                        pass  # TODO truncate instead of ignoring size errors.
-                    except Exception as e:
-                        self.bot.dispatch(
-                            "error", "logging_error", tb=utils.traceback_maker(e)
-                        )
-                    embeds.clear()
-                    files.clear()
-                    self.tasks[webhook] = objects[10:]
-
-    @dispatch_webhooks.error  # For unhandled errors
-    async def logging_error(self, exc):
-        self.bot.dispatch("error", "logging_error", tb=utils.traceback_maker(exc))
-
     @decorators.group(
         name="log",
         brief="Enable specific logging events.",
@@ -359,7 +338,7 @@ class Logging(commands.Cog):
             self.log_data[ctx.guild.id].clear()  # Clear data cache
             self.settings[ctx.guild.id].clear()  # Clear settings cache
             self.webhooks.pop(ctx.guild.id, None)  # Clear cached webhook
-            self.tasks.pop(webhook, None)  # Delete any pending embeds/files to be sent.
+            self.dispatcher.drop(webhook)  # Delete any pending embeds/files to be sent.
             await ctx.success("Logging successfully disabled.")
 
     @_log.command(
@@ -554,7 +533,7 @@ class Logging(commands.Cog):
             self.log_data[guild.id].clear()  # Clear data cache
             self.settings[guild.id].clear()  # Clear settings cache
             self.webhooks.pop(guild.id, None)  # Clear cached webhook
-            self.tasks.pop(webhook, None)  # Delete any pending embeds/files to be sent.
+            self.dispatcher.drop(webhook)  # Delete any pending embeds/files to be sent.
 
     @commands.Cog.listener()
     @decorators.wait_until_ready()
@@ -1032,7 +1011,7 @@ class Logging(commands.Cog):
     @decorators.wait_until_ready()
     @decorators.event_check(lambda s, b, a: a.guild and not a.author.bot)
     async def on_message_edit(self, before, after):
-        self.edited.append(before)
+        self.edited.add(before)
         if before.content == after.content:
             return  # giphy, tenor, and imgur links trigger this but they shouldn't be logged
 
@@ -1083,7 +1062,7 @@ class Logging(commands.Cog):
     @decorators.event_check(lambda s, m: m.guild and not m.author.bot)
     async def on_message_delete(self, message):
 
-        self.snipes.append(message)
+        self.snipes.add(message)
 
         webhook = self.get_webhook(message.guild, "messages")
         if not webhook:
@@ -1170,27 +1149,14 @@ class Logging(commands.Cog):
         Notes:
             Will fetch a messages sent by a specific user if specified
         """
-
-        def get_snipe(author_id=None):
-            msgs = [m for m in self.snipes if m.channel.id == ctx.channel.id]
-            if author_id:
-                msgs = [m for m in msgs if m.author.id == author_id]
-
-            if msgs:
-                return msgs[-1]
-
-        if member is None:
-            msg = get_snipe()
-        else:
-            msg = get_snipe(member.id)
-
+        msg = self.snipes.get(ctx.channel.id, member.id if member else None)
         if not msg:
             return await ctx.fail(f"There is nothing to snipe.")
 
-        author = msg.author.id
-        message_id = msg.id
+        author = msg.author_id
+        message_id = msg.message_id
         content = msg.content
-        timestamp = msg.created_at.utcnow()
+        timestamp = msg.created_at
 
         author = self.bot.get_user(author)
         if not author:
@@ -1231,27 +1197,14 @@ class Logging(commands.Cog):
         Notes:
             Will fetch a messages sent by a specific user if specified
         """
-
-        def get_snipe(author_id=None):
-            msgs = [m for m in self.edited if m.channel.id == ctx.channel.id]
-            if author_id:
-                msgs = [m for m in msgs if m.author_id == author_id]
-
-            if msgs:
-                return msgs[-1]
-
-        if member is None:
-            msg = get_snipe()
-        else:
-            msg = get_snipe(member.id)
-
+        msg = self.edited.get(ctx.channel.id, member.id if member else None)
         if not msg:
             return await ctx.fail(f"There are no edits to snipe.")
 
-        author = msg.author.id
-        message_id = msg.id
+        author = msg.author_id
+        message_id = msg.message_id
         content = msg.content
-        timestamp = msg.created_at.utcnow()
+        timestamp = msg.created_at
 
         author = self.bot.get_user(author)
         if not author:
@@ -1567,7 +1520,7 @@ class Logging(commands.Cog):
                     WHERE unix > $1
                 );
                 """
-        active_users = await self.bot.cxn.fetchval(query, diff)
+        active_users = await self.bot.analytics_cxn.fetchval(query, diff)
         inactive_users = [
             str(g)
             for g in ctx.guild.members
@@ -5,6 +5,7 @@ import asyncio
 import threading
 import psutil
 import sys
+import json
 import functools
 import objgraph
 import traceback
@@ -13,6 +14,7 @@ from discord.ext import commands, menus
 
 from utilities import checks
 from utilities import decorators
+from utilities import formatting
 from utilities import pagination
 
 
@@ -424,6 +426,58 @@ class Monitor(commands.Cog):
         except menus.MenuError as e:
             await ctx.send_or_reply(e)
 
+    @decorators.command(aliases=["ingeststats"], brief="Show batch ingest metrics.")
+    async def ingest(self, ctx, option: str = None):
+        """
+        Usage: {0}ingest [json]
+        Alias: {0}ingeststats
+        Output:
+            Flush counts, latency and errors per loop,
+            rows buffered and flushed per table.
+            Pass json to get the raw snapshot.
+        """
+        batch = self.bot.get_cog("Batch")
+        if not batch:
+            return await ctx.fail("The Batch cog is not loaded.")
+
+        snapshot = batch.snapshot()
+        if option and option.lower() == "json":
+            data = io.BytesIO(json.dumps(snapshot, indent=2).encode("utf-8"))
+            return await ctx.send_or_reply(
+                file=discord.File(data, filename="ingest.json")
+            )
+
+        metrics = batch.metrics
+        loops = formatting.TabularData()
+        loops.set_columns(["LOOP", "FLUSHES", "ERRORS", "P50", "P95", "LOCK P95"])
+        for loop in sorted({*metrics.flushes, *metrics.errors}):
+            duration = metrics.duration[loop]
+            loops.add_row(
+                [
+                    loop,
+                    metrics.flushes[loop],
+                    metrics.errors[loop],
+                    f"{duration.quantile(0.5):.3f}s",
+                    f"{duration.quantile(0.95):.3f}s",
+                    f"{metrics.lock_wait[loop].quantile(0.95):.3f}s",
+                ]
+            )
+
+        tables = formatting.TabularData()
+        tables.set_columns(["TABLE", "FLUSHED", "ROWS P50", "ROWS P95"])
+        for table, rows in sorted(metrics.rows.items()):
+            histogram = metrics.batch_rows[table]
+            tables.add_row(
+                [table, rows, histogram.quantile(0.5), histogram.quantile(0.95)]
+            )
+
+        buffered = sum(snapshot["buffered"].values())
+        await ctx.send_or_reply(
+            f"**Ingest** ({buffered:,} entries buffered, "
+            f"{snapshot['writer']['pending']:,} rows pending retry)"
+            f"```sml\n{loops.render()}\n{tables.render()}```"
+        )
+
     @decorators.command(brief="Show bot health.")
     async def bothealth(self, ctx):
         """
@@ -500,6 +554,69 @@ class Monitor(commands.Cog):
             name="Events Waiting", value=f"Total: {len(event_tasks)}", inline=False
         )
 
+        batch = self.bot.get_cog("Batch")
+        if batch:
+            writer = batch.writer
+            total_warnings += writer.breaker.state != "closed"
+            total_warnings += bool(writer.stats["quarantined"])
+            embed.add_field(
+                name="Ingest Buffer",
+                value=f"Circuit: {writer.breaker.state}\n"
+                f"Queued: {writer.stats['queued']:,} rows\n"
+                f"Spilled: {writer.stats['spilled']:,} rows\n"
+                f"Replayed: {writer.stats['replayed']:,} rows\n"
+                f"Quarantined: {writer.stats['quarantined']:,} rows",
+                inline=False,
+            )
+            if batch.partitions:
+                deepest = max(batch.partitions.values(), key=lambda p: p.depth)
+                slowest = max(
+                    batch.partitions.values(),
+                    key=lambda p: max(p.latency.values(), default=0),
+                )
+                embed.add_field(
+                    name="Ingest Shards",
+                    value=f"Partitions: {len(batch.partitions)}\n"
+                    f"Deepest: #{deepest.shard_id} ({deepest.depth:,} waiting)\n"
+                    f"Slowest: #{slowest.shard_id} "
+                    f"({max(slowest.latency.values(), default=0):.2f} s flush)",
+                    inline=False,
+                )
+
+        log_handler = self.bot.log_handler
+        total_warnings += bool(log_handler.dropped)
+        embed.add_field(
+            name="Log Queue",
+            value=f"Queued: {log_handler.queue.qsize():,} records\n"
+            f"Dropped: {log_handler.dropped:,} records",
+            inline=False,
+        )
+
+        if self.bot.hook_latency:
+            name, slowest = max(
+                self.bot.hook_latency.items(), key=lambda item: item[1].quantile(0.99)
+            )
+            embed.add_field(
+                name="Message Hooks",
+                value=f"Registered: {len(self.bot.message_hooks)}\n"
+                f"Slowest: {name} ({slowest.quantile(0.99) * 1000:.0f} ms p99)",
+                inline=False,
+            )
+
+        cog = self.bot.get_cog("Logging")
+        if cog:
+            dispatcher = cog.dispatcher
+            total_warnings += bool(dispatcher.dropped)
+            embed.add_field(
+                name="Log Delivery",
+                value=f"Latency: {dispatcher.latency.quantile(0.5):.2f} s p50, "
+                f"{dispatcher.latency.quantile(0.99):.2f} s p99\n"
+                f"Queued: {dispatcher.queued:,} objects "
+                f"({len(dispatcher.outboxes)} webhooks)\n"
+                f"Dropped: {dispatcher.dropped:,} objects",
+                inline=False,
+            )
+
         memory_usage = self.process.memory_full_info().uss / 1024 ** 2
         cpu_usage = self.process.cpu_percent() / psutil.cpu_count()
         embed.add_field(
@@ -11,6 +11,7 @@ from utilities import checks
 from utilities import converters
 from utilities import decorators
 from utilities import pagination
+from utilities import queries
 
 
 async def setup(bot):
@@ -1236,13 +1237,9 @@ class Stats(commands.Cog):
         Get the number of commands run by a member
         inside a specific server. (Not bot wide)
         """
-        query = """
-                SELECT COUNT(*)
-                FROM commands
-                WHERE author_id = $1
-                AND server_id = $2;
-                """
-        cmd_count = await self.bot.cxn.fetchval(query, member.id, member.guild.id)
+        cmd_count = await self.bot.analytics_cxn.fetchval(
+            queries.COMMAND_COUNT, member.id, member.guild.id
+        )
         return cmd_count or 0
 
     async def get_user_msgs(self, member):
@@ -1250,13 +1247,9 @@ class Stats(commands.Cog):
         Get the number of messages send by a member
         inside a specific server. (Not bot wide)
         """
-        query = """
-                SELECT COUNT(*)
-                FROM messages
-                WHERE author_id = $1
-                AND server_id = $2;
-                """
-        msg_count = await self.bot.cxn.fetchval(query, member.id, member.guild.id)
+        msg_count = await self.bot.analytics_cxn.fetchval(
+            queries.MESSAGE_COUNT, member.id, member.guild.id
+        )
         return msg_count or 0
 
     def role_accumulate(self, check_roles, members):
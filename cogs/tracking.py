@@ -9,6 +9,7 @@ from datetime import datetime, timedelta
 from discord.ext import commands, menus
 from PIL import Image, ImageDraw, ImageFont
 
+from utilities import db
 from utilities import utils
 from utilities import checks
 from utilities import images
@@ -18,6 +19,7 @@ from utilities import converters
 from utilities import decorators
 from utilities import formatting
 from utilities import pagination
+from utilities import queries
 
 
 async def setup(bot):
@@ -356,13 +358,9 @@ class Tracking(commands.Cog):
         user = user or ctx.author
         if user.bot:
             raise commands.BadArgument("I do not track bots.")
-        query = """
-                SELECT COUNT(*) as c
-                FROM messages
-                WHERE author_id = $1
-                AND server_id = $2
-                """
-        count = await self.bot.cxn.fetchval(query, user.id, ctx.guild.id)
+        count = await self.bot.analytics_cxn.fetchval(
+            queries.MESSAGE_COUNT, user.id, ctx.guild.id
+        )
         await ctx.send_or_reply(
             f"`{user}` has sent **{count}** message{'' if count == 1 else 's'}"
         )
@@ -393,17 +391,9 @@ class Tracking(commands.Cog):
         if not str(limit).isdigit():
             raise commands.BadArgument("The `limit` argument must be an integer.")
 
-        query = """
-                SELECT author_id,
-                count(author_id)
-                FROM messages
-                WHERE server_id = $1
-                GROUP BY author_id
-                ORDER BY COUNT(author_id)
-                DESC LIMIT $2
-                """
-
-        msg_data = await self.bot.cxn.fetch(query, ctx.guild.id, limit)
+        msg_data = await self.bot.analytics_cxn.fetch(
+            queries.TOP_SENDERS, ctx.guild.id, limit
+        )
         total = sum([row[1] for row in msg_data])
         entries = [f"<@!{row[0]}>. **Messages:** {row[1]:,}" for row in msg_data]
 
@@ -916,16 +906,9 @@ class Tracking(commands.Cog):
             raise commands.BadArgument("The `limit` argument must be greater than 1.")
 
         if user is None:  # Check for whole server
-            query = """
-                    SELECT command, COUNT(command) as c
-                    FROM commands
-                    WHERE server_id = $1
-                    GROUP BY command
-                    ORDER BY c DESC
-                    LIMIT $2;
-                    """
-
-            command_list = await self.bot.cxn.fetch(query, ctx.guild.id, limit)
+            command_list = await self.bot.analytics_cxn.fetch(
+                queries.COMMAND_STATS, ctx.guild.id, limit
+            )
             if not command_list:
                 return await ctx.fail(
                     f"No commands have been recorded in for this server."
@@ -938,16 +921,9 @@ class Tracking(commands.Cog):
                 ctx, user.id
             )
 
-            query = """
-                    SELECT command, COUNT(commands) as c
-                    FROM commands
-                    WHERE server_id = $1
-                    AND author_id = $2
-                    GROUP BY command
-                    ORDER BY c DESC
-                    LIMIT $3;
-                    """
-            command_list = await self.bot.cxn.fetch(query, ctx.guild.id, user.id, limit)
+            command_list = await self.bot.analytics_cxn.fetch(
+                queries.USER_COMMAND_STATS, ctx.guild.id, user.id, limit
+            )
             if not command_list:
                 return await ctx.fail(f"User `{user}` has not run any commands.")
 
@@ -1005,25 +981,18 @@ class Tracking(commands.Cog):
             will show total server commands.
         """
         if user is None:
-            query = """
-                    SELECT COUNT(*) as c
-                    FROM commands
-                    WHERE server_id = $1;
-                    """
-            command_count = await self.bot.cxn.fetchval(query, ctx.guild.id)
+            command_count = await self.bot.analytics_cxn.fetchval(
+                queries.SERVER_COMMAND_COUNT, ctx.guild.id
+            )
             return await ctx.send_or_reply(
                 f"{self.bot.emote_dict['graph']} A total of **{command_count:,}** command{' has' if command_count == 1 else 's have'} been executed on this server.",
             )
         else:
             if user.bot:
                 return await ctx.fail("I do not track bots.")
-            query = """
-                    SELECT COUNT(*) as c
-                    FROM commands
-                    WHERE author_id = $1
-                    AND server_id = $2;
-                    """
-            command_count = await self.bot.cxn.fetchval(query, user.id, ctx.guild.id)
+            command_count = await self.bot.analytics_cxn.fetchval(
+                queries.COMMAND_COUNT, user.id, ctx.guild.id
+            )
             return await ctx.send_or_reply(
                 f"{self.bot.emote_dict['graph']} User `{user}` has executed **{command_count:,}** command{'' if command_count == 1 else 's'}.",
             )
@@ -1054,14 +1023,7 @@ class Tracking(commands.Cog):
         time_dict = {"day": 86400, "week": 604800, "month": 2592000, "year": 31556952}
         if unit not in time_dict:
             unit = "month"
-        query = """
-                SELECT COUNT(*) as c, author_id
-                FROM commands
-                WHERE server_id = $1
-                GROUP BY author_id
-                ORDER BY c DESC LIMIT 25;
-                """
-        usage = await self.bot.cxn.fetch(query, ctx.guild.id)
+        usage = await self.bot.analytics_cxn.fetch(queries.BOT_USAGE, ctx.guild.id)
         e = discord.Embed(
             title=f"Bot usage for the last {unit}",
             description=f"{sum(x[0] for x in usage)} commands from {len(usage)} user{'' if len(usage) == 1 else 's'}",
@@ -1272,16 +1234,10 @@ class Tracking(commands.Cog):
             unit = "month"
         time_seconds = time_dict.get(unit, 2592000)
         now = int(time.time())
-        diff = now - time_seconds
-        query = """
-                SELECT COUNT(*) as c, author_id
-                FROM messages
-                WHERE server_id = $1
-                AND unix > $2
-                GROUP BY author_id
-                ORDER BY c DESC LIMIT 25;
-                """
-        stuff = await self.bot.cxn.fetch(query, ctx.guild.id, diff)
+        diff = db.hour(now - time_seconds)
+        stuff = await self.bot.analytics_cxn.fetch(
+            queries.MESSAGE_LEADERBOARD, ctx.guild.id, diff
+        )
 
         e = discord.Embed(
             title=f"Message Leaderboard",
@@ -1342,28 +1298,18 @@ class Tracking(commands.Cog):
             since = since.dt
 
         seconds_ago = (discord.utils.utcnow() - since).total_seconds()
-        diff = time.time() - seconds_ago
+        diff = db.hour(time.time() - seconds_ago)
 
         if channel:
-            condition = "AND channel_id = $3"
+            query = queries.CHANNEL_MESSAGE_STATS
             args = (ctx.guild.id, diff, channel.id)
             title_fmt = channel.mention
         else:
-            condition = ""
+            query = queries.MESSAGE_STATS
             args = (ctx.guild.id, diff)
             title_fmt = f"**{ctx.guild.name}**"
 
-        query = f"""
-                SELECT COUNT(*) as c, author_id as author
-                FROM messages
-                WHERE server_id = $1
-                AND unix > $2
-                {condition}
-                GROUP BY author_id
-                ORDER BY c DESC
-                LIMIT 100;
-                """
-        records = await self.bot.cxn.fetch(query, *args)
+        records = await self.bot.analytics_cxn.fetch(query, *args)
         if not records:
             await ctx.fail(
                 f"No messate statistics available in {title_fmt} for that time period."
@@ -1443,17 +1389,11 @@ class Tracking(commands.Cog):
             since = since.dt
 
         seconds_ago = (discord.utils.utcnow() - since).total_seconds()
-        diff = time.time() - seconds_ago
+        diff = db.hour(time.time() - seconds_ago)
 
-        query = """
-                SELECT COUNT(*) as c, channel_id
-                FROM messages
-                WHERE server_id = $1
-                AND unix > $2
-                GROUP BY channel_id
-                ORDER BY c DESC
-                """
-        records = await self.bot.cxn.fetch(query, ctx.guild.id, diff)
+        records = await self.bot.analytics_cxn.fetch(
+            queries.CHANNEL_STATS, ctx.guild.id, diff
+        )
         if not records:
             await ctx.fail(
                 f"No channel activity statistics available in **{ctx.guild.name}** for that time period."
@@ -1590,17 +1530,11 @@ class Tracking(commands.Cog):
             user = ctx.author
         await ctx.trigger_typing()
 
-        query = """
-                SELECT COUNT(subquery.days) FROM (SELECT DISTINCT
-                (SELECT EXTRACT(DAY FROM (TO_TIMESTAMP(unix)))::SMALLINT AS days)
-                FROM messages
-                WHERE unix > (SELECT EXTRACT(EPOCH FROM NOW()) - 2592000)
-                AND server_id = $1 AND author_id = $2) AS subquery;
-                """  # 2592000 = seconds in a month
         days = await self.bot.cxn.fetchval(
-            query,
+            queries.CLOCKER,
             ctx.guild.id,
             user.id,
+            int(time.time() // 86400),
         )
         emote = self.bot.emote_dict["graph"]
         user = f"**{user}** `{user.id}`"
@@ -1627,17 +1561,9 @@ class Tracking(commands.Cog):
             in the server during the past month.
         """
         await ctx.trigger_typing()
-        query = """
-                SELECT subquery.user, COUNT(subquery.days) AS days FROM (SELECT DISTINCT
-                (SELECT EXTRACT(DAY FROM (TO_TIMESTAMP(unix)))::SMALLINT AS days),
-                (SELECT author_id AS user)
-                FROM messages
-                WHERE unix > (SELECT EXTRACT(EPOCH FROM NOW()) - 2592000)
-                AND server_id = $1) AS subquery
-                GROUP BY subquery.user
-                ORDER BY days DESC;
-                """  # 2592000 = seconds in a month
-        rows = await self.bot.cxn.fetch(query, ctx.guild.id)
+        rows = await self.bot.analytics_cxn.fetch(
+            queries.CLOCKING, ctx.guild.id, int(time.time() // 86400)
+        )
 
         def pred(snowflake):
             mem = ctx.guild.get_member(snowflake)
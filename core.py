@@ -6,17 +6,16 @@ import json
 import time
 import aiohttp
 import asyncio
-import asyncpg
 import discord
 import logging
 import traceback
 import collections
 
 from discord.ext import commands, tasks
-from logging.handlers import RotatingFileHandler
 
 from settings import constants
-from utilities import utils, saver, override, http, db
+from utilities import utils, saver, override, http, db, cache, logqueue, pools
+from utilities import ingest
 
 import config
 
@@ -37,14 +36,13 @@ if not os.path.exists("./data/json"):
 # Set up our command logger
 command_logger = logging.getLogger("COMMAND_LOGGER")
 command_logger.setLevel(logging.DEBUG)
-command_logger_handler = RotatingFileHandler(
+command_logger_handler = logqueue.BufferedRotatingFileHandler(
     filename="./data/logs/commands.log",
     encoding="utf-8",
     mode="w",
     maxBytes=MAX_LOGGING_BYTES,
     backupCount=5,
 )
-command_logger.addHandler(command_logger_handler)
 command_logger_format = logging.Formatter(
     "\n{asctime}: [{levelname}] {name} || {message}", "%Y-%m-%d %H:%M:%S", style="{"
 )
@@ -53,14 +51,13 @@ command_logger_handler.setFormatter(command_logger_format)
 # Set up our basic info logger
 info_logger = logging.getLogger("INFO_LOGGER")
 info_logger.setLevel(logging.INFO)
-info_logger_handler = RotatingFileHandler(
+info_logger_handler = logqueue.BufferedRotatingFileHandler(
     filename="./data/logs/info.log",
     encoding="utf-8",
     mode="w",
     maxBytes=MAX_LOGGING_BYTES,
     backupCount=5,
 )
-info_logger.addHandler(info_logger_handler)
 info_logger_format = logging.Formatter(
     "{asctime}: [{levelname}] {name} || {message}", "%Y-%m-%d %H:%M:%S", style="{"
 )
@@ -69,14 +66,13 @@ info_logger_handler.setFormatter(info_logger_format)
 # Set up the error logger
 error_logger = logging.getLogger("ERROR_LOGGER")
 error_logger.setLevel(logging.WARNING)
-error_logger_handler = RotatingFileHandler(
+error_logger_handler = logqueue.BufferedRotatingFileHandler(
     filename="./data/logs/errors.log",
     encoding="utf-8",
     mode="w",
     maxBytes=MAX_LOGGING_BYTES,
     backupCount=5,
 )
-error_logger.addHandler(error_logger_handler)
 error_logger_format = logging.Formatter(
     "{asctime}: [{levelname}] {name} || {message}", "%Y-%m-%d %H:%M:%S", style="{"
 )
@@ -86,19 +82,30 @@ error_logger_handler.setFormatter(error_logger_format)
 # Set up the traceback logger this just dumps all the errors
 traceback_logger = logging.getLogger("TRACEBACK_LOGGER")
 traceback_logger.setLevel(logging.WARNING)
-traceback_logger_handler = RotatingFileHandler(
+traceback_logger_handler = logqueue.BufferedRotatingFileHandler(
     filename="./data/logs/traceback.log",
     encoding="utf-8",
     mode="w",
     maxBytes=MAX_LOGGING_BYTES,
     backupCount=5,
 )
-traceback_logger.addHandler(traceback_logger_handler)
 traceback_logger_format = logging.Formatter(
     "{asctime}: [{levelname}] {name} || {message}", "%Y-%m-%d %H:%M:%S", style="{"
 )
 traceback_logger_handler.setFormatter(traceback_logger_format)
 
+# File writes happen on a listener thread, never on the event loop.
+# "drop" discards records while the queue is full, "block" waits.
+log_handler, log_listener = logqueue.attach(
+    {
+        command_logger: command_logger_handler,
+        info_logger: info_logger_handler,
+        error_logger: error_logger_handler,
+        traceback_logger: traceback_logger_handler,
+    },
+    block=getattr(config, "LOG_BACKPRESSURE", "drop") == "block",
+)
+
 
 def get_prefixes(bot, msg):
     """
@@ -115,6 +122,14 @@ def get_prefixes(bot, msg):
     return base
 
 
+def compile_prefixes(prefixes):
+    """
+    Build one pattern matching any of the prefixes,
+    tried in the same order as the list.
+    """
+    return re.compile("|".join(re.escape(p) for p in prefixes if p is not None))
+
+
 # Main bot class. Heart of the application
 class Neutra(commands.AutoShardedBot):
     def __init__(self):
@@ -167,8 +182,19 @@ class Neutra(commands.AutoShardedBot):
         ]  # Common prefixes that are valid in DMs
         self.ready = False
         self.prefixes = {}
+        # guild_id (None in DMs): compiled prefix pattern. Dropped
+        # whenever that guild's prefixes change and rebuilt on use.
+        self.prefix_matchers = {}
 
         self.socket_events = collections.Counter()
+        self.log_handler = log_handler  # Exposes the dropped record count
+
+        # Cogs with a message(message) filter that runs before every
+        # command. Kept up to date as cogs are added and removed.
+        self.message_hooks = {}  # cog name: coroutine
+        self.hook_latency = collections.defaultdict(
+            lambda: ingest.Histogram(ingest.LATENCY_BUCKETS)
+        )  # cog name: seconds per call
 
         self.admin_cogs = [
             "BOTCONFIG",
@@ -247,6 +273,17 @@ class Neutra(commands.AutoShardedBot):
         if not hasattr(self, "blacklist"):
             self.blacklist = blacklist
 
+    async def add_cog(self, cog, **kwargs):
+        await super().add_cog(cog, **kwargs)
+        hook = getattr(cog, "message", None)
+        if asyncio.iscoroutinefunction(hook):
+            self.message_hooks[cog.qualified_name] = hook
+
+    async def remove_cog(self, name, **kwargs):
+        self.message_hooks.pop(name, None)
+        self.hook_latency.pop(name, None)
+        return await super().remove_cog(name, **kwargs)
+
     async def load_extension(self, name, *, package=None):
         self.dispatch("loaded_extension", name)
         return await super().load_extension(name, package=package)
@@ -277,6 +314,7 @@ class Neutra(commands.AutoShardedBot):
 
         await super().close()
         await self.session.close()
+        log_listener.stop()  # Flush whatever is still queued
 
     ##############################
     ## Aiohttp Helper Functions ##
@@ -350,13 +388,17 @@ class Neutra(commands.AutoShardedBot):
         # Check if we need to ignore, delete or react to the message
         ignore, delete, react = False, False, False
         respond = None
-        for cog in self.cogs:
-            cog = self.get_cog(cog)
-            try:
-                check = await cog.message(message)
-            except AttributeError:
-                continue
-
+        hooks = list(self.message_hooks.items())
+        results = await asyncio.gather(
+            *(self.run_message_hook(name, hook, message) for name, hook in hooks),
+            return_exceptions=True,
+        )
+        for (name, hook), check in zip(hooks, results):
+            if isinstance(check, Exception):
+                # A failing hook is reported and the others still count.
+                self.dispatch(
+                    "error", "hook_error", name, tb=utils.traceback_maker(check)
+                )
             if not type(check) is dict:
                 check = {}
             if check.get("Delete", False):
@@ -384,6 +426,13 @@ class Neutra(commands.AutoShardedBot):
         if not ignore:
             await self.invoke(ctx)
 
+    async def run_message_hook(self, name, hook, message):
+        start = time.perf_counter()
+        try:
+            return await hook(message)
+        finally:
+            self.hook_latency[name].observe(time.perf_counter() - start)
+
     @tasks.loop(minutes=10)
     async def status_loop(self):
         """
@@ -414,23 +463,49 @@ class Neutra(commands.AutoShardedBot):
 
     async def create_db(self):
         if self.development:
-            self.cxn = await asyncpg.create_pool(config.DEVELOPMENT.POSTGRES.uri)
+            postgres = config.DEVELOPMENT.POSTGRES
         elif self.tester:
-            self.cxn = await asyncpg.create_pool(config.TESTER.POSTGRES.uri)
+            postgres = config.TESTER.POSTGRES
         elif self.production:
-            self.cxn = await asyncpg.create_pool(config.PRODUCTION.POSTGRES.uri)
+            postgres = config.PRODUCTION.POSTGRES
+
+        # One pool per workload, see pools.POOLS. Analytics
+        # can be sent to a replica with analytics_uri.
+        self.pools = await pools.create_pools(
+            postgres.uri,
+            analytics_dsn=getattr(postgres, "analytics_uri", None),
+            overrides=getattr(config, "POSTGRES_POOLS", None),
+        )
+        self.cxn = self.pools["interactive"]
+        self.ingest_cxn = self.pools["ingest"]
+        self.analytics_cxn = self.pools["analytics"]
 
         self.database = db.Database(self.cxn)
         self.prefixes = self.database.prefixes
         self.server_settings = self.database.settings
 
-        member_list = [x for x in self.get_all_members()]
         try:
-            await self.database.initialize(self, member_list)
+            await self.database.initialize(self)
+            self.prefix_matchers.clear()  # Built before the prefixes loaded
             print(utils.prefix_log("Initialized Database."))
         except Exception as e:
             print(utils.traceback_maker(e))
 
+    async def sync_database(self):
+        """
+        Add every member the bot can see to the db.
+        Runs in the background once the bot is ready.
+        """
+        st = time.time()
+        member_ids = {member.id for member in self.get_all_members()}
+        try:
+            await self.database.sync_members(member_ids)
+        except Exception as e:
+            print(utils.traceback_maker(e))
+            return
+        print(utils.prefix_log(f"Synced {len(member_ids)} members."))
+        print(utils.prefix_log(f"Elapsed time: {str(time.time() - st)[:10]} s"))
+
     async def setup_webhooks(self):
         try:
             self.avatar_webhook = await self.fetch_webhook(
@@ -507,13 +582,7 @@ class Neutra(commands.AutoShardedBot):
             self.http_utils = http.Utils(self.session)
 
         if not hasattr(self, "invites"):
-
-            self.invites = {
-                # TODO
-                # guild.id: await guild.invites()
-                # for guild in self.guilds
-                # if guild.me.guild_permissions.manage_guild
-            }
+            self.invites = cache.InviteCache()  # Seeded by the Batch cog.
 
         print(utils.prefix_log("Established Globals."))
 
@@ -594,6 +663,7 @@ class Neutra(commands.AutoShardedBot):
             pass
 
         self.ready = True
+        self.loop.create_task(self.sync_database())
 
         # See if we were rebooted by a command and send confirmation if we were.
         query = """
@@ -623,6 +693,23 @@ class Neutra(commands.AutoShardedBot):
         context = await super().get_context(message, cls=override.BotContext)
         return context
 
+    async def get_prefix(self, message):
+        """
+        Match the message against its guild's compiled prefixes
+        in one pass. Returns the prefix that was used, or an
+        empty list so get_context bails out straight away.
+        """
+        match = self.prefix_matcher(message.guild).match(message.content)
+        return match.group(0) if match else []
+
+    def prefix_matcher(self, guild):
+        key = guild.id if guild else None
+        matcher = self.prefix_matchers.get(key)
+        if matcher is None:
+            prefixes = self.get_guild_prefixes(guild)
+            matcher = self.prefix_matchers[key] = compile_prefixes(prefixes)
+        return matcher
+
     def get_guild_prefixes(self, guild, *, local_inject=get_prefixes):
         proxy_msg = discord.Object(id=0)
         proxy_msg.guild = guild
@@ -640,6 +727,7 @@ class Neutra(commands.AutoShardedBot):
         else:
             await self.put_prefixes(guild.id, prefixes)
             self.prefixes[guild.id] = prefixes
+        self.prefix_matchers.pop(guild.id, None)
 
     async def put_prefixes(self, guild_id, prefixes):
         query = """
@@ -653,6 +741,7 @@ class Neutra(commands.AutoShardedBot):
                 """
         await self.cxn.executemany(query, ((guild_id, prefix) for prefix in prefixes))
         self.prefixes[guild_id] = prefixes
+        self.prefix_matchers.pop(guild_id, None)
 
     def get_cogs(self):
         """
@@ -856,10 +945,11 @@ class Neutra(commands.AutoShardedBot):
         if self.ready is False:
             return
 
+        await self.database.restore_server(guild.id)  # If it left recently
         await self.database.update_server(guild, guild.members)
         await self.database.fix_server(guild.id)
         if guild.me.guild_permissions.manage_guild:
-            self.invites[guild.id] = await guild.invites()
+            self.invites.load(guild.id, await guild.invites())
         try:
             await self.logging_webhook.send(
                 f"**Information** `{discord.utils.utcnow()}`\n"
@@ -874,6 +964,7 @@ class Neutra(commands.AutoShardedBot):
         # This happens when the bot gets kicked from a server.
         # No need to waste any space storing their info anymore.
 
+        self.invites.drop(guild.id)
         await self.database.destroy_server(guild.id)
         try:
             await self.logging_webhook.send(
@@ -0,0 +1,18 @@
+-- migrate: no-transaction
+-- Composite indexes for the per server and per user analytics in the tracking cog.
+-- Built concurrently so ingest keeps writing while they build.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS messages_server_unix_idx
+ON messages (server_id, unix) INCLUDE (author_id, channel_id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS messages_server_channel_unix_idx
+ON messages (server_id, channel_id, unix) INCLUDE (author_id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS messages_author_server_unix_idx
+ON messages (author_id, server_id, unix);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS commands_server_author_idx
+ON commands (server_id, author_id) INCLUDE (command, timestamp);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS commands_author_server_idx
+ON commands (author_id, server_id);
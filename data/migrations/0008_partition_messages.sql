@@ -0,0 +1,83 @@
+-- migrate: no-transaction
+-- Turn messages into a table range partitioned by month on unix.
+-- The existing heap is attached as the first partition so no rows
+-- are copied. Later months are created ahead of time by the batch cog.
+-- Every step checks whether it already ran, so a failed run can be retried.
+
+-- Rows without a time can't be routed to a partition.
+DO $$
+BEGIN
+    IF to_regclass('messages_legacy') IS NULL THEN
+        DELETE FROM messages WHERE unix IS NULL;
+    END IF;
+END $$;
+
+-- A validated CHECK matching the partition bound lets ATTACH skip its
+-- scan of the heap. Adding it NOT VALID is instant and VALIDATE scans
+-- the heap without blocking writes, so the scan happens here, once,
+-- instead of under the ACCESS EXCLUSIVE lock the swap below holds.
+-- Expect this step to take about as long as a sequential scan of messages.
+DO $$
+BEGIN
+    IF to_regclass('messages_legacy') IS NULL
+    AND NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'messages_legacy_bound') THEN
+        EXECUTE format(
+            'ALTER TABLE messages ADD CONSTRAINT messages_legacy_bound '
+            'CHECK (unix IS NOT NULL AND unix < %s::REAL) NOT VALID',
+            EXTRACT(EPOCH FROM DATE_TRUNC('month', NOW() AT TIME ZONE 'UTC') + INTERVAL '1 month')
+        );
+    END IF;
+END $$;
+
+DO $$
+BEGIN
+    IF to_regclass('messages_legacy') IS NULL THEN
+        ALTER TABLE messages VALIDATE CONSTRAINT messages_legacy_bound;
+    END IF;
+END $$;
+
+-- The swap runs as one statement, so it either happens or it doesn't.
+DO $$
+BEGIN
+    IF to_regclass('messages_legacy') IS NOT NULL THEN
+        RETURN;
+    END IF;
+
+    ALTER TABLE messages RENAME TO messages_legacy;
+    ALTER INDEX IF EXISTS messages_server_unix_idx RENAME TO messages_legacy_server_unix_idx;
+    ALTER INDEX IF EXISTS messages_server_channel_unix_idx RENAME TO messages_legacy_server_channel_unix_idx;
+    ALTER INDEX IF EXISTS messages_author_server_unix_idx RENAME TO messages_legacy_author_server_unix_idx;
+
+    CREATE TABLE messages (
+        index BIGINT NOT NULL DEFAULT nextval('messages_index_seq'),
+        unix REAL,
+        timestamp TIMESTAMP,
+        message_id BIGINT,
+        author_id BIGINT,
+        channel_id BIGINT,
+        server_id BIGINT,
+        deleted BOOLEAN DEFAULT False,
+        edited BOOLEAN DEFAULT False
+    ) PARTITION BY RANGE (unix);
+    ALTER SEQUENCE messages_index_seq OWNED BY messages.index;
+
+    -- Created before attaching so the matching legacy indexes are reused.
+    CREATE INDEX messages_server_unix_idx
+    ON messages (server_id, unix) INCLUDE (author_id, channel_id);
+    CREATE INDEX messages_server_channel_unix_idx
+    ON messages (server_id, channel_id, unix) INCLUDE (author_id);
+    CREATE INDEX messages_author_server_unix_idx
+    ON messages (author_id, server_id, unix);
+
+    -- Catches rows outside every monthly partition.
+    CREATE TABLE messages_default PARTITION OF messages DEFAULT;
+
+    -- The legacy heap holds everything up to the start of next month. If
+    -- the month turned since the CHECK was added, its bound is still implied.
+    EXECUTE format(
+        'ALTER TABLE messages ATTACH PARTITION messages_legacy FOR VALUES FROM (MINVALUE) TO (%s)',
+        EXTRACT(EPOCH FROM DATE_TRUNC('month', NOW() AT TIME ZONE 'UTC') + INTERVAL '1 month')
+    );
+    -- The partition bound enforces it from here on.
+    ALTER TABLE messages_legacy DROP CONSTRAINT messages_legacy_bound;
+END $$;
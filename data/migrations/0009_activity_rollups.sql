@@ -0,0 +1,43 @@
+-- Hourly activity counters kept up to date by the batch cog.
+-- hour is the unix time the hour starts at.
+
+CREATE TABLE IF NOT EXISTS message_rollups (
+    server_id BIGINT NOT NULL,
+    channel_id BIGINT NOT NULL,
+    author_id BIGINT NOT NULL,
+    hour BIGINT NOT NULL,
+    total BIGINT DEFAULT 0 NOT NULL,
+    PRIMARY KEY (server_id, hour, channel_id, author_id)
+);
+CREATE INDEX IF NOT EXISTS message_rollups_author_idx ON message_rollups(author_id, server_id);
+
+CREATE TABLE IF NOT EXISTS command_rollups (
+    server_id BIGINT NOT NULL,
+    author_id BIGINT NOT NULL,
+    command TEXT NOT NULL,
+    hour BIGINT NOT NULL,
+    total BIGINT DEFAULT 0 NOT NULL,
+    PRIMARY KEY (server_id, hour, author_id, command)
+);
+CREATE INDEX IF NOT EXISTS command_rollups_author_idx ON command_rollups(author_id, server_id);
+
+-- Backfill from the raw rows recorded so far.
+INSERT INTO message_rollups (server_id, channel_id, author_id, hour, total)
+SELECT server_id, channel_id, author_id, (FLOOR(unix / 3600) * 3600)::BIGINT, COUNT(*)
+FROM messages
+WHERE server_id IS NOT NULL
+AND channel_id IS NOT NULL
+AND author_id IS NOT NULL
+AND unix IS NOT NULL
+GROUP BY 1, 2, 3, 4
+ON CONFLICT DO NOTHING;
+
+INSERT INTO command_rollups (server_id, author_id, command, hour, total)
+SELECT server_id, author_id, command, (FLOOR(EXTRACT(EPOCH FROM timestamp) / 3600) * 3600)::BIGINT, COUNT(*)
+FROM commands
+WHERE server_id IS NOT NULL
+AND author_id IS NOT NULL
+AND command IS NOT NULL
+AND timestamp IS NOT NULL
+GROUP BY 1, 2, 3, 4
+ON CONFLICT DO NOTHING;
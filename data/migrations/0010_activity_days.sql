@@ -0,0 +1,48 @@
+-- Days each user sent a message in a server, as a bitmap. Bit i is
+-- set if they were active i days before day (days since the epoch).
+-- Only the low 63 bits are used so the value stays positive.
+
+CREATE TABLE IF NOT EXISTS activity_days (
+    server_id BIGINT NOT NULL,
+    user_id BIGINT NOT NULL,
+    day INTEGER NOT NULL,
+    days BIGINT DEFAULT 0 NOT NULL,
+    PRIMARY KEY (server_id, user_id)
+);
+
+-- Move a bitmap forward by count days, forgetting days past the 63rd.
+CREATE OR REPLACE FUNCTION shift_days(bitmap BIGINT, count INTEGER)
+RETURNS BIGINT AS $$
+    SELECT CASE
+        WHEN count >= 63 THEN 0
+        ELSE (bitmap << count) & 9223372036854775807
+    END;
+$$ LANGUAGE SQL IMMUTABLE;
+
+-- Days active out of the span days ending on today.
+CREATE OR REPLACE FUNCTION active_days(bitmap BIGINT, last_day INTEGER, today INTEGER, span INTEGER)
+RETURNS INTEGER AS $$
+    SELECT CASE
+        WHEN span - (today - last_day) <= 0 THEN 0
+        WHEN span - (today - last_day) >= 63 THEN LENGTH(REPLACE(bitmap::BIT(64)::TEXT, '0', ''))
+        ELSE LENGTH(REPLACE(
+            (bitmap & ((1::BIGINT << (span - (today - last_day))) - 1))::BIT(64)::TEXT, '0', ''
+        ))
+    END;
+$$ LANGUAGE SQL IMMUTABLE;
+
+-- Backfill the last 63 days from the hourly message rollups.
+WITH active AS (
+    SELECT DISTINCT server_id, author_id, (hour / 86400)::INTEGER AS day
+    FROM message_rollups
+    WHERE hour >= (EXTRACT(EPOCH FROM NOW())::BIGINT / 86400 - 62) * 86400
+), latest AS (
+    SELECT server_id, author_id, day,
+    MAX(day) OVER (PARTITION BY server_id, author_id) AS last_day
+    FROM active
+)
+INSERT INTO activity_days (server_id, user_id, day, days)
+SELECT server_id, author_id, last_day, BIT_OR(1::BIGINT << (last_day - day))
+FROM latest
+GROUP BY server_id, author_id, last_day
+ON CONFLICT DO NOTHING;
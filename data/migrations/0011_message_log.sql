@@ -0,0 +1,59 @@
+-- Compact message storage. Only the ids are kept, the time a message
+-- was sent is read back out of its snowflake. The batch cog writes to
+-- both tables while it copies the old rows over a server at a time,
+-- then replaces messages with a view over message_log.
+
+CREATE OR REPLACE FUNCTION snowflake_unix(snowflake BIGINT)
+RETURNS DOUBLE PRECISION AS $$
+    SELECT ((snowflake >> 22) + 1420070400000) / 1000.0::DOUBLE PRECISION;
+$$ LANGUAGE SQL IMMUTABLE;
+
+-- The smallest snowflake created at or after unix.
+CREATE OR REPLACE FUNCTION unix_snowflake(unix DOUBLE PRECISION)
+RETURNS BIGINT AS $$
+    SELECT ((unix * 1000)::BIGINT - 1420070400000) << 22;
+$$ LANGUAGE SQL IMMUTABLE;
+
+CREATE TABLE IF NOT EXISTS message_log (
+    message_id BIGINT NOT NULL,
+    author_id BIGINT,
+    channel_id BIGINT,
+    server_id BIGINT,
+    PRIMARY KEY (message_id)
+) PARTITION BY RANGE (message_id);
+
+CREATE INDEX IF NOT EXISTS message_log_server_idx
+ON message_log (server_id, message_id) INCLUDE (author_id, channel_id);
+CREATE INDEX IF NOT EXISTS message_log_server_channel_idx
+ON message_log (server_id, channel_id, message_id) INCLUDE (author_id);
+CREATE INDEX IF NOT EXISTS message_log_author_server_idx
+ON message_log (author_id, server_id, message_id);
+
+CREATE TABLE IF NOT EXISTS message_log_default PARTITION OF message_log DEFAULT;
+
+-- Monthly partitions from the oldest recorded activity through next month.
+DO $$
+DECLARE
+    current_month TIMESTAMP := DATE_TRUNC('month', COALESCE(
+        (SELECT TO_TIMESTAMP(MIN(hour)) AT TIME ZONE 'UTC' FROM message_rollups),
+        NOW() AT TIME ZONE 'UTC'
+    ));
+BEGIN
+    WHILE current_month <= DATE_TRUNC('month', NOW() AT TIME ZONE 'UTC') + INTERVAL '1 month' LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF message_log FOR VALUES FROM (%s) TO (%s)',
+            'message_log_' || TO_CHAR(current_month, '"y"YYYY"m"MM'),
+            unix_snowflake(EXTRACT(EPOCH FROM current_month)),
+            unix_snowflake(EXTRACT(EPOCH FROM current_month + INTERVAL '1 month'))
+        );
+        current_month := current_month + INTERVAL '1 month';
+    END LOOP;
+END $$;
+
+-- Progress of the copy from messages, by server_id.
+CREATE TABLE IF NOT EXISTS message_backfill (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    position BIGINT NOT NULL DEFAULT 0,
+    done BOOLEAN NOT NULL DEFAULT FALSE
+);
+INSERT INTO message_backfill DEFAULT VALUES ON CONFLICT DO NOTHING;
@@ -0,0 +1,25 @@
+-- migrate: no-transaction
+-- Queued deletes of everything stored on a user or a server. The batch
+-- cog works through them in chunks, step is the index into db.ERASURES.
+CREATE TABLE IF NOT EXISTS erasure_jobs (
+    id BIGSERIAL PRIMARY KEY,
+    kind TEXT NOT NULL,
+    target BIGINT NOT NULL,
+    step INTEGER DEFAULT 0 NOT NULL,
+    deleted BIGINT DEFAULT 0 NOT NULL,
+    created TIMESTAMP DEFAULT (NOW() AT TIME ZONE 'UTC'),
+    finished TIMESTAMP
+);
+CREATE UNIQUE INDEX IF NOT EXISTS erasure_jobs_pending_idx
+ON erasure_jobs (kind, target) WHERE finished IS NULL;
+
+-- Every chunk finds its rows through an index.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS useravatars_user_idx ON useravatars (user_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS voice_user_idx ON voice (user_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS statuses_user_idx ON statuses (user_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS emojidata_author_idx ON emojidata (author_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS activity_days_user_idx ON activity_days (user_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS warns_server_idx ON warns (server_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS invites_server_idx ON invites (server_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS usernicks_server_idx ON usernicks (server_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS userroles_server_idx ON userroles (server_id);
@@ -0,0 +1,181 @@
+# Runs the erasure jobs against a real database. Point NEUTRA_TEST_DSN
+# at a scratch database, the migrations are applied to it and the test
+# rows below are written and erased there.
+import os
+import time
+import asyncio
+
+import pytest
+
+asyncpg = pytest.importorskip("asyncpg")
+
+from utilities import db  # noqa: E402
+from utilities import migrations  # noqa: E402
+
+DSN = os.environ.get("NEUTRA_TEST_DSN")
+pytestmark = pytest.mark.skipif(DSN is None, reason="NEUTRA_TEST_DSN is not set")
+
+USER = 900000000000000001
+OTHER_USER = 900000000000000002
+SERVER = 900000000000000011
+OTHER_SERVER = 900000000000000012
+CHANNEL = 900000000000000021
+
+# Small enough that every step takes several chunks.
+LIMIT = 2
+
+
+async def seed(conn):
+    now = time.time()
+    snowflake = 900000000000000100
+    for user, server in (
+        (USER, SERVER),
+        (USER, OTHER_SERVER),
+        (OTHER_USER, SERVER),
+        (OTHER_USER, OTHER_SERVER),
+    ):
+        for _ in range(LIMIT * 2 + 1):
+            snowflake += 1
+            await conn.execute(
+                """
+                INSERT INTO messages (unix, message_id, author_id, channel_id, server_id)
+                VALUES ($1, $2, $3, $4, $5);
+                """,
+                now,
+                snowflake,
+                user,
+                CHANNEL,
+                server,
+            )
+            await conn.execute(
+                """
+                INSERT INTO message_log (message_id, author_id, channel_id, server_id)
+                VALUES ($1, $2, $3, $4);
+                """,
+                snowflake,
+                user,
+                CHANNEL,
+                server,
+            )
+        await conn.execute(
+            """
+            INSERT INTO usernicks (user_id, server_id, nickname)
+            VALUES ($1, $2, 'nick');
+            """,
+            user,
+            server,
+        )
+        await conn.execute(
+            """
+            INSERT INTO command_rollups (server_id, author_id, command, hour, total)
+            VALUES ($1, $2, 'ping', 0, 1);
+            """,
+            server,
+            user,
+        )
+        await conn.execute(
+            """
+            INSERT INTO activity_days (server_id, user_id, day, days)
+            VALUES ($1, $2, 0, 1);
+            """,
+            server,
+            user,
+        )
+
+    for user in (USER, OTHER_USER):
+        for name in range(LIMIT * 2 + 1):
+            await conn.execute(
+                "INSERT INTO usernames (user_id, username) VALUES ($1, $2);",
+                user,
+                str(name),
+            )
+        await conn.execute(
+            "INSERT INTO avatars (hash) VALUES ($1);",
+            str(user),
+        )
+        await conn.execute(
+            "INSERT INTO useravatars (user_id, avatar) VALUES ($1, $2);",
+            user,
+            str(user),
+        )
+
+    for server in (SERVER, OTHER_SERVER):
+        await conn.execute("INSERT INTO servers (server_id) VALUES ($1);", server)
+        await conn.execute(
+            "INSERT INTO prefixes (server_id, prefix) VALUES ($1, '!');", server
+        )
+
+
+async def clear(conn):
+    for kind, target in (("user", USER), ("user", OTHER_USER)):
+        for table, column, _ in db.ERASURES[kind]:
+            await conn.execute(f"DELETE FROM {table} WHERE {column} = $1;", target)
+    for server in (SERVER, OTHER_SERVER):
+        for table, column, _ in db.ERASURES["server"]:
+            await conn.execute(f"DELETE FROM {table} WHERE {column} = $1;", server)
+    await conn.execute(
+        "DELETE FROM avatars WHERE hash = ANY($1::TEXT[]);",
+        [str(USER), str(OTHER_USER)],
+    )
+    await conn.execute(
+        "DELETE FROM erasure_jobs WHERE target = ANY($1::BIGINT[]);",
+        [USER, OTHER_USER, SERVER, OTHER_SERVER],
+    )
+
+
+async def count(conn, table, column, target):
+    return await conn.fetchval(
+        f"SELECT COUNT(*) FROM {table} WHERE {column} = $1;", target
+    )
+
+
+async def erase(pool, kind, target):
+    await db.queue_erasure(pool, kind, target)
+    job = next(
+        job
+        for job in await db.pending_erasures(pool)
+        if job["kind"] == kind and job["target"] == target
+    )
+    for _ in range(1000):
+        job = await db.erase_chunk(pool, job, LIMIT)
+        assert job is not None
+        if job["finished"]:
+            return job
+    pytest.fail(f"{kind} erasure of {target} never finished")
+
+
+async def run(kind, target, other):
+    pool = await asyncpg.create_pool(DSN, min_size=1, max_size=2)
+    try:
+        await migrations.migrate(pool)
+        async with pool.acquire() as conn:
+            await clear(conn)
+            await seed(conn)
+            before = {
+                (table, column): await count(conn, table, column, other)
+                for table, column, _ in db.ERASURES[kind]
+            }
+
+        job = await erase(pool, kind, target)
+        assert job["step"] == len(db.ERASURES[kind])
+        assert job["deleted"] > 0
+
+        async with pool.acquire() as conn:
+            for table, column, _ in db.ERASURES[kind]:
+                assert await count(conn, table, column, target) == 0, table
+                after = await count(conn, table, column, other)
+                assert after == before[(table, column)], table
+            if kind == "user":
+                assert await count(conn, "avatars", "hash", str(target)) == 0
+                assert await count(conn, "avatars", "hash", str(other)) == 1
+            await clear(conn)
+    finally:
+        await pool.close()
+
+
+def test_user_erasure():
+    asyncio.run(run("user", USER, OTHER_USER))
+
+
+def test_server_erasure():
+    asyncio.run(run("server", SERVER, OTHER_SERVER))
@@ -0,0 +1,238 @@
+import time
+
+from collections import OrderedDict, defaultdict, deque
+
+
+class LRU:
+    """
+    Mapping that evicts the least recently used
+    key once it holds more than maxsize entries.
+    """
+
+    __slots__ = ("maxsize", "_data")
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __setitem__(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def get(self, key, default=None):
+        try:
+            self._data.move_to_end(key)
+        except KeyError:
+            return default
+        return self._data[key]
+
+    def pop(self, key, default=None):
+        return self._data.pop(key, default)
+
+    def keys(self):
+        return self._data.keys()
+
+
+class InviteCache:
+    """
+    Invite uses per guild as code: uses maps,
+    with the inviter of each code kept alongside.
+    """
+
+    __slots__ = ("uses", "inviters")
+
+    def __init__(self):
+        self.uses = {}  # guild_id: {code: uses}
+        self.inviters = {}  # code: inviter_id
+
+    def __contains__(self, guild_id):
+        return guild_id in self.uses
+
+    def add(self, invite):
+        codes = self.uses.get(invite.guild.id)
+        if codes is None:
+            return  # Not seeded yet, the next load picks it up.
+        codes[invite.code] = invite.uses or 0
+        if invite.inviter:
+            self.inviters[invite.code] = invite.inviter.id
+
+    def remove(self, invite):
+        codes = self.uses.get(invite.guild.id)
+        if codes is not None:
+            codes.pop(invite.code, None)
+        self.inviters.pop(invite.code, None)
+
+    def drop(self, guild_id):
+        for code in self.uses.pop(guild_id, ()):
+            self.inviters.pop(code, None)
+
+    def load(self, guild_id, invites):
+        """
+        Replace a guild's invites and return a
+        {code: new uses} map of what changed since
+        the last load. Unseeded guilds return {}.
+        """
+        old = self.uses.get(guild_id)
+        new = {}
+        for invite in invites:
+            new[invite.code] = invite.uses or 0
+            if invite.inviter:
+                self.inviters[invite.code] = invite.inviter.id
+
+        self.uses[guild_id] = new
+        if old is None:
+            return {}
+
+        for code in old.keys() - new.keys():
+            self.inviters.pop(code, None)
+        return {
+            code: uses - old.get(code, 0)
+            for code, uses in new.items()
+            if uses > old.get(code, 0)
+        }
+
+
+class PermissionIndex:
+    """
+    Ignored entities and disabled commands for the Config
+    cog's bot checks and checks.is_disabled. Every lookup
+    is a hash probe or a set intersection with the roles.
+    """
+
+    def __init__(self):
+        self.ignored = {}  # guild_id: frozenset of channel, role and user ids
+        self.disabled = {}  # entity_id: frozenset of command names
+        self.disabled_for = {}  # command name: frozenset of entity ids
+
+    def load_ignored(self, records):
+        """
+        Replace the ignored entities with
+        (guild_id, entity ids) records.
+        """
+        self.ignored = {guild_id: frozenset(entities) for guild_id, entities in records}
+
+    def load_disabled(self, records):
+        """
+        Replace the disabled commands with
+        (entity_id, command names) records.
+        """
+        self.disabled = {}
+        disabled_for = defaultdict(set)
+        for entity_id, commands in records:
+            self.disabled[entity_id] = frozenset(commands)
+            for command in commands:
+                disabled_for[command].add(entity_id)
+        self.disabled_for = {
+            command: frozenset(entities) for command, entities in disabled_for.items()
+        }
+
+    def ignore(self, guild_id, *entity_ids):
+        ignored = self.ignored.get(guild_id, frozenset())
+        self.ignored[guild_id] = ignored.union(entity_ids)
+
+    def unignore(self, guild_id, *entity_ids):
+        ignored = self.ignored.get(guild_id, frozenset())
+        self.ignored[guild_id] = ignored.difference(entity_ids)
+
+    def clear_ignored(self, guild_id):
+        self.ignored.pop(guild_id, None)
+
+    def disable(self, entity_id, *commands):
+        disabled = self.disabled.get(entity_id, frozenset())
+        self.disabled[entity_id] = disabled.union(commands)
+        for command in commands:
+            entities = self.disabled_for.get(command, frozenset())
+            self.disabled_for[command] = entities.union((entity_id,))
+
+    def enable(self, entity_id, *commands):
+        disabled = self.disabled.get(entity_id, frozenset())
+        self.disabled[entity_id] = disabled.difference(commands)
+        for command in commands:
+            entities = self.disabled_for.get(command, frozenset())
+            self.disabled_for[command] = entities.difference((entity_id,))
+
+    def is_ignored(self, guild_id, channel_id, user_id, role_ids):
+        ignored = self.ignored.get(guild_id)
+        if not ignored:
+            return False
+        # The default role has the guild's id.
+        return (
+            channel_id in ignored
+            or user_id in ignored
+            or guild_id in ignored
+            or not ignored.isdisjoint(role_ids)
+        )
+
+    def is_disabled(self, command, guild_id, channel_id, user_id, role_ids):
+        entities = self.disabled_for.get(command)
+        if not entities:
+            return False
+        return (
+            guild_id in entities
+            or channel_id in entities
+            or user_id in entities
+            or not entities.isdisjoint(role_ids)
+        )
+
+
+class Snapshot:
+    """
+    The parts of a message the snipe commands show.
+    Holds no references to discord models.
+    """
+
+    __slots__ = ("message_id", "author_id", "content", "created_at", "stored")
+
+    def __init__(self, message):
+        self.message_id = message.id
+        self.author_id = message.author.id
+        self.content = message.content
+        self.created_at = message.created_at
+        self.stored = time.monotonic()
+
+
+class SnipeStore:
+    """
+    Ring buffer of the last size snapshots per channel, plus
+    the latest snapshot per (channel, author). Both are LRU
+    capped and snapshots older than ttl seconds are expired.
+    """
+
+    def __init__(self, size, ttl, *, channels, authors):
+        self.size = size
+        self.ttl = ttl
+        self.channels = LRU(channels)  # channel_id: deque of Snapshot
+        self.authors = LRU(authors)  # (channel_id, author_id): Snapshot
+
+    def add(self, message):
+        snapshot = Snapshot(message)
+        buffer = self.channels.get(message.channel.id)
+        if buffer is None:
+            buffer = self.channels[message.channel.id] = deque(maxlen=self.size)
+        buffer.append(snapshot)
+        self.authors[(message.channel.id, snapshot.author_id)] = snapshot
+
+    def get(self, channel_id, author_id=None):
+        """
+        Get the latest live snapshot in a channel,
+        or the latest one by author_id if passed.
+        """
+        if author_id is None:
+            buffer = self.channels.get(channel_id)
+            snapshot = buffer[-1] if buffer else None
+        else:
+            snapshot = self.authors.get((channel_id, author_id))
+
+        if snapshot is None:
+            return None
+        if time.monotonic() - snapshot.stored > self.ttl:
+            return None
+        return snapshot
@@ -1,13 +1,704 @@
-import os
+import re
 import json
 import time
 import logging
 
 from collections import defaultdict
-from utilities import utils
+from datetime import datetime, timezone
+from utilities import migrations
+from utilities import pools
 
 log = logging.getLogger("INFO_LOGGER")
 
+# Column layouts for the append only tables written by the batch cog.
+# Batched rows are plain tuples in exactly this column order.
+LAYOUTS = {
+    "messages": (
+        ("unix", "REAL"),
+        ("timestamp", "TIMESTAMP"),
+        ("message_id", "BIGINT"),
+        ("author_id", "BIGINT"),
+        ("channel_id", "BIGINT"),
+        ("server_id", "BIGINT"),
+    ),
+    "message_log": (
+        ("message_id", "BIGINT"),
+        ("author_id", "BIGINT"),
+        ("channel_id", "BIGINT"),
+        ("server_id", "BIGINT"),
+    ),
+    "commands": (
+        ("server_id", "BIGINT"),
+        ("channel_id", "BIGINT"),
+        ("author_id", "BIGINT"),
+        ("timestamp", "TIMESTAMP"),
+        ("prefix", "TEXT"),
+        ("command", "TEXT"),
+        ("failed", "BOOLEAN"),
+    ),
+    "usernames": (
+        ("user_id", "BIGINT"),
+        ("username", "TEXT"),
+    ),
+    "usernicks": (
+        ("user_id", "BIGINT"),
+        ("server_id", "BIGINT"),
+        ("nickname", "TEXT"),
+    ),
+    "invites": (
+        ("invitee", "BIGINT"),
+        ("inviter", "BIGINT"),
+        ("server_id", "BIGINT"),
+    ),
+    "voice": (
+        ("server_id", "BIGINT"),
+        ("user_id", "BIGINT"),
+        ("connected", "BOOLEAN"),
+        ("first_seen", "TIMESTAMP"),
+    ),
+    "statuses": (
+        ("user_id", "BIGINT"),
+        ("status", "TEXT"),
+        ("first_seen", "TIMESTAMP"),
+    ),
+}
+
+
+def columns(table):
+    return [column for column, _ in LAYOUTS[table]]
+
+
+def jsonb_query(table, target=None):
+    """
+    Build the JSONB_TO_RECORDSET insert
+    for a table in LAYOUTS.
+    """
+    names = ", ".join(columns(table))
+    selected = ", ".join(f"x.{column}" for column in columns(table))
+    types = ", ".join(f"{column} {kind}" for column, kind in LAYOUTS[table])
+    return f"""
+            INSERT INTO {target or table} ({names})
+            SELECT {selected}
+            FROM JSONB_TO_RECORDSET($1::JSONB)
+            AS x({types});
+            """
+
+
+async def copy_records(cxn, table, records, *, target=None):
+    """
+    Bulk write tuples with the binary COPY protocol.
+    cxn can be either a pool or a single connection.
+    """
+    await cxn.copy_records_to_table(
+        target or table, records=records, columns=columns(table)
+    )
+
+
+async def jsonb_records(cxn, table, records, *, target=None):
+    """
+    Bulk write tuples as one JSONB payload.
+    Kept as a fallback for the COPY writer.
+    """
+    names = columns(table)
+    data = json.dumps([dict(zip(names, record)) for record in records], default=str)
+    await cxn.execute(jsonb_query(table, target), data)
+
+
+async def upsert_last_seen(cxn, rows, *, target="tracker"):
+    """
+    Upsert (user_id, unix, action) rows in one statement.
+    Only the newest action of each user is kept.
+    """
+    query = f"""
+            INSERT INTO {target} (user_id, unix, action)
+            SELECT DISTINCT ON (x.user_id) x.user_id, x.unix, x.action
+            FROM UNNEST($1::BIGINT[], $2::DOUBLE PRECISION[], $3::TEXT[])
+            AS x(user_id, unix, action)
+            ORDER BY x.user_id, x.unix DESC
+            ON CONFLICT (user_id)
+            DO UPDATE SET unix = EXCLUDED.unix, action = EXCLUDED.action
+            WHERE {target}.unix IS NULL OR {target}.unix <= EXCLUDED.unix;
+            """
+    user_ids, timestamps, actions = map(list, zip(*rows))
+    await cxn.execute(query, user_ids, timestamps, actions)
+
+
+# Hourly counters kept by the batch cog. Rows are the
+# key columns in this order followed by the count to add.
+ROLLUPS = {
+    "message_rollups": (
+        ("server_id", "BIGINT"),
+        ("channel_id", "BIGINT"),
+        ("author_id", "BIGINT"),
+        ("hour", "BIGINT"),
+    ),
+    "command_rollups": (
+        ("server_id", "BIGINT"),
+        ("author_id", "BIGINT"),
+        ("command", "TEXT"),
+        ("hour", "BIGINT"),
+    ),
+}
+
+
+def hour(unix):
+    """
+    Unix time of the start of the hour.
+    """
+    return int(unix) // 3600 * 3600
+
+
+async def upsert_rollup(cxn, table, rows):
+    """
+    Add (*key, count) rows onto an hourly rollup in one statement.
+    """
+    layout = ROLLUPS[table]
+    keys = ", ".join(column for column, _ in layout)
+    arrays = ", ".join(f"${i}::{kind}[]" for i, (_, kind) in enumerate(layout, 1))
+    query = f"""
+            INSERT INTO {table} ({keys}, total)
+            SELECT * FROM UNNEST({arrays}, ${len(layout) + 1}::BIGINT[])
+            ON CONFLICT ({keys})
+            DO UPDATE SET total = {table}.total + EXCLUDED.total;
+            """
+    await cxn.execute(query, *map(list, zip(*rows)))
+
+
+async def upsert_activity_days(cxn, rows):
+    """
+    Merge (server_id, user_id, day, bitmap) rows into activity_days.
+    Both bitmaps are shifted to the later day and OR'd together.
+    """
+    query = """
+            INSERT INTO activity_days AS a (server_id, user_id, day, days)
+            SELECT * FROM UNNEST($1::BIGINT[], $2::BIGINT[], $3::INTEGER[], $4::BIGINT[])
+            ON CONFLICT (server_id, user_id)
+            DO UPDATE SET
+            day = GREATEST(a.day, EXCLUDED.day),
+            days = shift_days(a.days, GREATEST(a.day, EXCLUDED.day) - a.day)
+            | shift_days(EXCLUDED.days, GREATEST(a.day, EXCLUDED.day) - EXCLUDED.day);
+            """
+    await cxn.execute(query, *map(list, zip(*rows)))
+
+
+# Tables the reset messages commands clear, with their author column.
+# The rollups and activity bitmaps are counted from the raw rows and
+# commands are messages too, so they all go together. Until the
+# backfill swaps in the view, messages and message_log both hold rows.
+MESSAGE_DATA = (
+    ("messages", "author_id"),
+    ("message_log", "author_id"),
+    ("message_rollups", "author_id"),
+    ("activity_days", "user_id"),
+    ("commands", "author_id"),
+    ("command_rollups", "author_id"),
+)
+
+
+async def reset_messages(conn, server_id, author_id=None):
+    """
+    Delete the recorded messages on a server and everything
+    counted from them, only author_id's if passed.
+    """
+    async with conn.transaction():
+        for table, column in MESSAGE_DATA:
+            if author_id is None:
+                query = f"DELETE FROM {table} WHERE server_id = $1;"
+                await conn.execute(query, server_id)
+            else:
+                query = f"DELETE FROM {table} WHERE server_id = $1 AND {column} = $2;"
+                await conn.execute(query, server_id, author_id)
+
+
+PARTITION_BOUND_REGEX = re.compile(r"TO \('?([^')]+)'?\)")
+
+# Milliseconds between the unix and discord epochs.
+DISCORD_EPOCH = 1420070400000
+
+
+def snowflake(unix):
+    """
+    Get the smallest snowflake created at or after unix.
+    """
+    return (round(unix * 1000) - DISCORD_EPOCH) << 22
+
+
+def snowflake_unix(snowflake_id):
+    """
+    Get the unix time a snowflake was created at.
+    """
+    return ((snowflake_id >> 22) + DISCORD_EPOCH) / 1000
+
+
+# Monthly range partitioned tables, their partition key
+# and how bounds convert (to unix time, from unix time).
+# Partitioning is for retention, whole months are dropped
+# instead of deleted. The analytics reads come from the
+# rollups and none of the remaining message queries are
+# time bounded, so they don't benefit from pruning.
+PARTITIONED = {
+    "messages": ("unix", float, float),
+    "message_log": ("message_id", lambda bound: snowflake_unix(int(bound)), snowflake),
+}
+
+
+def month_after(unix):
+    """
+    Get the start of the month after the one a
+    day past unix. The day absorbs REAL rounding.
+    """
+    date = datetime.fromtimestamp(unix + 86400, timezone.utc)
+    month = date.year * 12 + date.month  # Months since year 0, 1 based
+    start = datetime(month // 12, month % 12 + 1, 1, tzinfo=timezone.utc)
+    return start, date.strftime("y%Ym%m")
+
+
+async def table_partitions(cxn, table):
+    """
+    Get [(name, upper bound as unix)] for a table's monthly
+    partitions, or None if the table is not partitioned.
+    """
+    query = """
+            SELECT child.relname AS name,
+            pg_get_expr(child.relpartbound, child.oid) AS bound
+            FROM pg_class parent
+            LEFT JOIN pg_inherits ON pg_inherits.inhparent = parent.oid
+            LEFT JOIN pg_class child ON pg_inherits.inhrelid = child.oid
+            WHERE parent.relname = $1
+            AND parent.relkind = 'p';
+            """
+    records = await cxn.fetch(query, table)
+    if not records:
+        return None
+    _, to_unix, _ = PARTITIONED[table]
+    partitions = []
+    for record in records:
+        match = PARTITION_BOUND_REGEX.search(record["bound"] or "")
+        if match:
+            partitions.append((record["name"], to_unix(match.group(1))))
+    return sorted(partitions, key=lambda p: p[1])
+
+
+async def create_partitions(cxn, table, *, months=2):
+    """
+    Create monthly partitions of table up to
+    months past the current one. Returns their names.
+    """
+    partitions = await table_partitions(cxn, table)
+    if partitions is None:
+        return []
+
+    key, _, to_bound = PARTITIONED[table]
+    created = []
+    horizon = time.time() + months * 31 * 86400
+    if partitions:
+        lower = partitions[-1][1]
+    else:  # Only the default partition, start from this month.
+        now = datetime.now(timezone.utc)
+        lower = datetime(now.year, now.month, 1, tzinfo=timezone.utc).timestamp()
+    while lower < horizon:
+        upper, suffix = month_after(lower)
+        name = f"{table}_{suffix}"
+        bounds = f"FROM ({to_bound(lower)}) TO ({to_bound(upper.timestamp())})"
+        async with cxn.acquire() as conn:
+            async with conn.transaction():
+                # Postgres refuses a partition for rows the default
+                # partition already holds, so those are moved into it.
+                query = f"""
+                        SELECT EXISTS (
+                            SELECT 1
+                            FROM {table}_default
+                            WHERE {key} >= {to_bound(lower)}
+                            AND {key} < {to_bound(upper.timestamp())}
+                        );
+                        """
+                if not await conn.fetchval(query):
+                    query = f"""
+                            CREATE TABLE IF NOT EXISTS {name}
+                            PARTITION OF {table}
+                            FOR VALUES {bounds};
+                            """
+                    await conn.execute(query)
+                else:
+                    await conn.execute(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE;")
+                    query = f"""
+                            CREATE TABLE {name}
+                            (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS);
+                            """
+                    await conn.execute(query)
+                    query = f"""
+                            WITH moved AS (
+                                DELETE FROM {table}_default
+                                WHERE {key} >= {to_bound(lower)}
+                                AND {key} < {to_bound(upper.timestamp())}
+                                RETURNING *
+                            )
+                            INSERT INTO {name}
+                            SELECT * FROM moved;
+                            """
+                    moved = await conn.execute(query)
+                    query = f"""
+                            ALTER TABLE {table}
+                            ATTACH PARTITION {name}
+                            FOR VALUES {bounds};
+                            """
+                    await conn.execute(query)
+                    log.info(f"Moved {moved.split()[-1]} default rows into {name}")
+        created.append(name)
+        lower = upper.timestamp()
+    return created
+
+
+async def drop_partitions(cxn, table, *, months):
+    """
+    Drop every partition of table that only holds
+    rows older than months ago. Returns their names.
+    """
+    partitions = await table_partitions(cxn, table)
+    if not partitions:
+        return []
+
+    cutoff = time.time() - months * 31 * 86400
+    dropped = []
+    for name, upper in partitions:
+        if upper > cutoff:
+            break
+        await cxn.execute(f"DROP TABLE {name};")
+        dropped.append(name)
+    return dropped
+
+
+async def messages_compacted(cxn):
+    """
+    Check if messages has been replaced
+    by the view over message_log yet.
+    """
+    query = """
+            SELECT relkind = 'v'
+            FROM pg_class
+            WHERE oid = to_regclass('messages');
+            """
+    return bool(await cxn.fetchval(query))
+
+
+async def backfill_message_log(cxn):
+    """
+    Copy the next server's rows from messages into message_log.
+    Returns the server copied, or None once every server is.
+    """
+    query = """
+            SELECT position, done
+            FROM message_backfill;
+            """
+    progress = await cxn.fetchrow(query)
+    if progress is None or progress["done"]:
+        return None
+
+    query = """
+            SELECT MIN(server_id)
+            FROM messages
+            WHERE server_id > $1;
+            """
+    server_id = await cxn.fetchval(query, progress["position"])
+    if server_id is not None:
+        # New rows are written to both tables, so the
+        # conflicts are rows that were already copied.
+        query = """
+                INSERT INTO message_log (message_id, author_id, channel_id, server_id)
+                SELECT message_id, author_id, channel_id, server_id
+                FROM messages
+                WHERE server_id = $1
+                AND message_id IS NOT NULL
+                ON CONFLICT DO NOTHING;
+                """
+        async with pools.unbounded(cxn) as conn:  # Large servers take a while
+            await conn.execute(query, server_id)
+        query = """
+                UPDATE message_backfill
+                SET position = $1;
+                """
+        await cxn.execute(query, server_id)
+        return server_id
+    return None
+
+
+async def compact_messages(cxn):
+    """
+    Swap messages for a view over message_log deriving
+    its time columns from the snowflake. Writers must
+    only write to message_log before this is called,
+    or their batches wait on the lock and hit the view.
+    """
+    async with cxn.acquire() as conn:
+        async with conn.transaction():
+            query = """
+                    SELECT done
+                    FROM message_backfill
+                    FOR UPDATE;
+                    """
+            if await conn.fetchval(query) is not False:
+                return  # Already swapped
+            await conn.execute("LOCK TABLE messages IN ACCESS EXCLUSIVE MODE;")
+            await conn.execute("ALTER TABLE messages RENAME TO messages_wide;")
+            query = """
+                    CREATE VIEW messages AS
+                    SELECT message_id, author_id, channel_id, server_id,
+                    snowflake_unix(message_id) AS unix,
+                    TO_TIMESTAMP(snowflake_unix(message_id))
+                    AT TIME ZONE 'UTC' AS timestamp
+                    FROM message_log;
+                    """
+            await conn.execute(query)
+            await conn.execute("DROP TABLE messages_wide;")
+            await conn.execute("UPDATE message_backfill SET done = TRUE;")
+    log.info("Replaced messages with a view over message_log")
+
+
+# Erasure jobs delete a user's or a server's rows one step at
+# a time, in this order. Steps are (table, column, chunk key),
+# the key picks out the rows of one chunk. Config tables go
+# first so a server that quickly adds the bot back keeps its
+# new settings once the job gets to the bulky tables.
+ERASURES = {
+    "user": (
+        ("useravatars", "user_id", "ctid"),
+        ("usernames", "user_id", "ctid"),
+        ("usernicks", "user_id", "ctid"),
+        ("userstatus", "user_id", "ctid"),
+        ("tracker", "user_id", "ctid"),
+        ("voice", "user_id", "ctid"),
+        ("statuses", "user_id", "ctid"),
+        ("emojidata", "author_id", "ctid"),
+        ("messages", "author_id", "message_id"),
+        ("message_log", "author_id", "message_id"),
+        ("message_rollups", "author_id", "ctid"),
+        ("command_rollups", "author_id", "ctid"),
+        ("activity_days", "user_id", "ctid"),
+    ),
+    "server": (
+        ("servers", "server_id", "ctid"),
+        ("prefixes", "server_id", "ctid"),
+        ("warns", "server_id", "ctid"),
+        ("invites", "server_id", "ctid"),
+        ("emojidata", "server_id", "ctid"),
+        ("usernicks", "server_id", "ctid"),
+        ("userroles", "server_id", "ctid"),
+        ("messages", "server_id", "message_id"),
+        ("message_log", "server_id", "message_id"),
+        ("message_rollups", "server_id", "ctid"),
+        ("command_rollups", "server_id", "ctid"),
+        ("activity_days", "server_id", "ctid"),
+    ),
+}
+
+
+def erasure_query(table, column, key):
+    """
+    Delete up to $2 rows of table where column = $1.
+    Returns the number of rows deleted.
+    """
+    # Partitioned tables and the messages view have no unique ctid,
+    # their chunks are picked out by message_id instead.
+    returning = "avatar" if table == "useravatars" else "1"
+    query = f"""
+            WITH deleted AS (
+                DELETE FROM {table}
+                WHERE {column} = $1
+                AND {key} = ANY(ARRAY(
+                    SELECT {key}
+                    FROM {table}
+                    WHERE {column} = $1
+                    LIMIT $2
+                ))
+                RETURNING {returning}
+            )
+            """
+    if table == "useravatars":  # Their avatars go with them.
+        query += """
+            , avatars AS (
+                DELETE FROM avatars
+                WHERE hash IN (
+                    SELECT avatar
+                    FROM deleted
+                )
+            )
+            """
+    return query + "SELECT COUNT(*) FROM deleted;"
+
+
+async def queue_erasure(cxn, kind, target):
+    """
+    Queue an erasure job unless one is
+    already pending for the same target.
+    """
+    query = """
+            INSERT INTO erasure_jobs (kind, target)
+            VALUES ($1, $2)
+            ON CONFLICT (kind, target) WHERE finished IS NULL
+            DO NOTHING;
+            """
+    await cxn.execute(query, kind, target)
+
+
+async def cancel_erasure(cxn, kind, target):
+    """
+    Delete the pending erasure job of a target, so
+    a server that adds the bot back or a user that
+    opts back in keeps the data written after that.
+    Waits for a chunk in progress to commit.
+    """
+    query = """
+            DELETE FROM erasure_jobs
+            WHERE kind = $1
+            AND target = $2
+            AND finished IS NULL;
+            """
+    await cxn.execute(query, kind, target)
+
+
+async def pending_erasures(cxn):
+    """
+    Get the unfinished erasure jobs, oldest first.
+    """
+    query = """
+            SELECT *
+            FROM erasure_jobs
+            WHERE finished IS NULL
+            ORDER BY id;
+            """
+    return await cxn.fetch(query)
+
+
+async def erase_chunk(cxn, job, limit):
+    """
+    Delete up to limit rows for the job's current step. A short
+    chunk means the step is done and the job moves on to the
+    next one. Returns the updated job record,
+    or None if the job was cancelled meanwhile.
+    """
+    steps = ERASURES[job["kind"]]
+    table, column, key = steps[job["step"]]
+    query = """
+            UPDATE erasure_jobs
+            SET step = $2,
+            deleted = deleted + $3,
+            finished = CASE WHEN $4
+            THEN NOW() AT TIME ZONE 'UTC' END
+            WHERE id = $1
+            RETURNING *;
+            """
+    async with cxn.acquire() as conn:
+        async with conn.transaction():
+            # Hold the job so cancel_erasure waits for this chunk.
+            locked = """
+                     SELECT id
+                     FROM erasure_jobs
+                     WHERE id = $1
+                     AND finished IS NULL
+                     FOR UPDATE;
+                     """
+            if await conn.fetchval(locked, job["id"]) is None:
+                return None
+            deleted = await conn.fetchval(
+                erasure_query(table, column, key), job["target"], limit
+            )
+            step = job["step"] + (deleted < limit)
+            finished = step >= len(steps)
+            return await conn.fetchrow(query, job["id"], step, deleted, finished)
+
+
+async def sync_ids(cxn, table, column, ids):
+    """
+    Insert every id missing from table with one COPY into a
+    temp table and one INSERT ... SELECT. Returns rows inserted.
+    """
+    async with cxn.acquire() as conn:
+        async with conn.transaction():
+            query = """
+                    CREATE TEMP TABLE sync_ids (id BIGINT)
+                    ON COMMIT DROP;
+                    """
+            await conn.execute(query)
+            await conn.execute("SET LOCAL statement_timeout = 0;")
+            await conn.copy_records_to_table(
+                "sync_ids", records=[(i,) for i in ids], columns=["id"]
+            )
+            query = f"""
+                    INSERT INTO {table} ({column})
+                    SELECT DISTINCT id FROM sync_ids
+                    ON CONFLICT DO NOTHING;
+                    """
+            status = await conn.execute(query)
+    return int(status.split()[-1])
+
+
+# Tables keyed by server_id that purge_orphans cleans up,
+# with the chunk key their rows are deleted by.
+ORPHANS = (
+    ("servers", "ctid"),
+    ("prefixes", "ctid"),
+    ("logs", "ctid"),
+    ("log_data", "ctid"),
+    ("warns", "ctid"),
+    ("invites", "ctid"),
+    ("emojidata", "ctid"),
+    ("usernicks", "ctid"),
+    ("userroles", "ctid"),
+    ("messages", "message_id"),
+    ("message_log", "message_id"),
+    ("message_rollups", "ctid"),
+    ("command_rollups", "ctid"),
+    ("activity_days", "ctid"),
+)
+
+
+async def purge_orphans(cxn, server_ids, tables=ORPHANS, *, limit=1000):
+    """
+    Delete the rows of servers not in server_ids, table by
+    table and limit rows at a time. Returns {table: rows}.
+    """
+    async with pools.unbounded(cxn) as conn:  # The scans run long
+        counts = {}
+        for table, key in tables:
+            # One pass over the table, anti joined to the live ids.
+            query = f"""
+                    SELECT DISTINCT server_id
+                    FROM {table}
+                    WHERE server_id IS NOT NULL
+                    AND NOT EXISTS (
+                        SELECT 1
+                        FROM UNNEST($1::BIGINT[]) AS live(server_id)
+                        WHERE live.server_id = {table}.server_id
+                    );
+                    """
+            orphans = [
+                record["server_id"] for record in await conn.fetch(query, server_ids)
+            ]
+            counts[table] = 0
+            if not orphans:
+                continue
+
+            query = f"""
+                    WITH deleted AS (
+                        DELETE FROM {table}
+                        WHERE server_id = ANY($1::BIGINT[])
+                        AND {key} = ANY(ARRAY(
+                            SELECT {key}
+                            FROM {table}
+                            WHERE server_id = ANY($1::BIGINT[])
+                            LIMIT $2
+                        ))
+                        RETURNING 1
+                    )
+                    SELECT COUNT(*) FROM deleted;
+                    """
+            while True:
+                deleted = await conn.fetchval(query, orphans, limit)
+                counts[table] += deleted
+                if deleted < limit:
+                    break
+    return counts
+
 
 class Database:
     def __init__(self, cxn):
@@ -15,15 +706,12 @@ class Database:
 
         self.prefixes = {}
         self.settings = defaultdict(dict)
-        self.scripts = [
-            x[:-4] for x in sorted(os.listdir("./data/scripts")) if x.endswith(".sql")
-        ]
 
-    async def initialize(self, bot, members):
-        await self.scriptexec()
+    async def initialize(self, bot):
+        await migrations.migrate(self.cxn)
         await self.set_config_id(bot)
         await self.load_prefixes()
-        await self.update_db(bot.guilds, members)
+        await self.update_db(bot.guilds)
         await self.load_settings()
 
     async def set_config_id(self, bot):
@@ -37,15 +725,6 @@ class Database:
                 """
         await self.cxn.execute(query, bot.user.id)
 
-    async def scriptexec(self):
-        # We execute the SQL script to make sure we have all our tables.
-        for script in self.scripts:
-            with open(f"./data/scripts/{script}.sql", "r", encoding="utf-8") as script:
-                try:
-                    await self.cxn.execute(script.read())
-                except Exception as e:
-                    print(utils.traceback_maker(e))
-
     async def update_server(self, server, member_list):
         # Update a server when the bot joins.
         query = """
@@ -54,40 +733,27 @@ class Database:
                 """
         st = time.time()
         await self.cxn.execute(query, server.id)
-
-        query = """
-                INSERT INTO userstatus (user_id)
-                VALUES ($1) ON CONFLICT DO NOTHING;
-                """
-        await self.cxn.executemany(
-            query,
-            ((m.id,) for m in member_list),
-        )
+        await sync_ids(self.cxn, "userstatus", "user_id", [m.id for m in member_list])
 
         log.info(f"Server {server.name} Updated [{server.id}] Time: {time.time() - st}")
 
-    async def update_db(self, guilds, member_list):
-        # Main database updater. This is mostly just for updating new servers and members that the bot joined when offline.
-        query = """
-                INSERT INTO servers (server_id) VALUES ($1)
-                ON CONFLICT DO NOTHING;
-                """
+    async def update_db(self, guilds):
+        # Add the servers the bot joined while offline. Their members
+        # are added by sync_members once the bot is ready.
         st = time.time()
-        await self.cxn.executemany(
-            query,
-            ((s.id,) for s in guilds),
-        )
-
-        query = """
-                INSERT INTO userstatus (user_id)
-                VALUES ($1) ON CONFLICT DO NOTHING;
-                """
-        await self.cxn.executemany(
-            query,
-            ((m.id,) for m in member_list),
-        )
+        await sync_ids(self.cxn, "servers", "server_id", [s.id for s in guilds])
         log.info(f"Database Update: {time.time() - st}")
 
+    async def sync_members(self, member_ids):
+        """
+        Add a userstatus row for every member the bot can see.
+        Returns the number of members that were new.
+        """
+        st = time.time()
+        inserted = await sync_ids(self.cxn, "userstatus", "user_id", member_ids)
+        log.info(f"Member Sync: {time.time() - st} Inserted: {inserted}")
+        return inserted
+
     async def load_settings(self):
         query = """
                 SELECT 
@@ -136,84 +802,26 @@ class Database:
             self.prefixes[server_id] = prefix_list
 
     async def basic_cleanup(self, guilds):
-        query = "SELECT server_id FROM servers"
-        await self.find_discrepancy(query, guilds)
-
-    async def find_discrepancy(self, query, guilds):
-        server_list = [x.id for x in guilds]
-        records = await self.cxn.fetch(query)
-        for record in records:
-            server_id = record["server_id"]
-            if server_id not in server_list:
-                await self.destroy_server(server_id)
+        """
+        Delete every record of servers that kicked
+        the bot while it was offline.
+        """
+        return await self.purge_discrepancies(guilds)
 
     async def purge_discrepancies(self, guilds):
-        print("Running purge_discrepancies(guilds)")
-        query = "SELECT server_id FROM servers"
-        await self.find_discrepancy(query, guilds)
-        print(f"{query.split()[-1]}_query")
-
-        query = "SELECT server_id FROM prefixes"
-        await self.find_discrepancy(query, guilds)
-        print(f"{query.split()[-1]}_query")
-
-        query = "SELECT server_id FROM logs"
-        await self.find_discrepancy(query, guilds)
-        print(f"{query.split()[-1]}_query")
-
-        query = "SELECT server_id FROM log_data"
-        await self.find_discrepancy(query, guilds)
-        print(f"{query.split()[-1]}_query")
-
-        query = "SELECT server_id FROM warns"
-        await self.find_discrepancy(query, guilds)
-        print(f"{query.split()[-1]}_query")
-
-        query = "SELECT server_id FROM invites"
-        await self.find_discrepancy(query, guilds)
-        print(f"{query.split()[-1]}_query")
-
-        query = "SELECT server_id FROM emojidata"
-        await self.find_discrepancy(query, guilds)
-        print(f"{query.split()[-1]}_query")
-
-        query = "SELECT server_id FROM messages"
-        await self.find_discrepancy(query, guilds)
-        print(f"{query.split()[-1]}_query")
-
-        query = "SELECT server_id FROM usernicks"
-        await self.find_discrepancy(query, guilds)
-        print(f"{query.split()[-1]}_query")
-
-        query = "SELECT server_id FROM userroles"
-        await self.find_discrepancy(query, guilds)
-        print(f"{query.split()[-1]}_query")
+        """
+        Delete the rows of every server the bot is no
+        longer in. Returns {table: rows deleted}.
+        """
+        counts = await purge_orphans(self.cxn, [guild.id for guild in guilds])
+        log.info(f"Purged discrepancies: {sum(counts.values())} rows")
+        return counts
 
     async def destroy_server(self, guild_id):
-        """Delete all records of a server from the db"""
-
-        query = "DELETE FROM servers WHERE server_id = $1"
-        await self.cxn.execute(query, guild_id)
-
-        query = "DELETE FROM prefixes WHERE server_id = $1"
-        await self.cxn.execute(query, guild_id)
-
-        query = "DELETE FROM warns WHERE server_id = $1"
-        await self.cxn.execute(query, guild_id)
-
-        query = "DELETE FROM invites WHERE server_id = $1"
-        await self.cxn.execute(query, guild_id)
-
-        query = "DELETE FROM emojidata WHERE server_id = $1"
-        await self.cxn.execute(query, guild_id)
-
-        query = "DELETE FROM messages WHERE server_id = $1"
-        await self.cxn.execute(query, guild_id)
-
-        query = "DELETE FROM usernicks WHERE server_id = $1"
-        await self.cxn.execute(query, guild_id)
-
-        query = "DELETE FROM userroles WHERE server_id = $1"
-        await self.cxn.execute(query, guild_id)
+        """Queue all records of a server for deletion"""
+        await queue_erasure(self.cxn, "server", guild_id)
+        log.info(f"Queued server [{guild_id}] for erasure")
 
-        log.info(f"Destroyed server [{guild_id}]")
+    async def restore_server(self, guild_id):
+        """Cancel the erasure of a server that added the bot back"""
+        await cancel_erasure(self.cxn, "server", guild_id)
@@ -0,0 +1,138 @@
+import time
+import bisect
+import asyncio
+
+from collections import Counter, defaultdict
+
+# Batch containers and the factory for an empty one.
+CONTAINERS = {
+    "command_batch": list,
+    "emote_batch": lambda: defaultdict(dict),
+    "invite_batch": list,
+    "message_batch": list,
+    "message_rollup": Counter,  # (server, channel, author, hour): messages
+    "activity_days": set,  # (server, author, day)
+    "command_rollup": Counter,  # (server, author, command, hour): commands
+    "nicknames_batch": list,
+    "presence_batch": list,
+    "roles_batch": lambda: defaultdict(dict),
+    "status_batch": lambda: defaultdict(list),
+    "tracking_batch": lambda: defaultdict(dict),
+    "usernames_batch": list,
+    "voice_batch": list,
+}
+
+# Histogram bucket upper bounds, seconds and rows.
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+ROW_BUCKETS = (1, 10, 50, 100, 500, 1000, 5000, 10000, 50000)
+
+
+class Partition:
+    """
+    Batch containers for a single shard. Listeners append
+    to them and the shard's own flush loops swap them out.
+    """
+
+    def __init__(self, shard_id):
+        self.shard_id = shard_id
+        self.lock = asyncio.Lock()
+        self.loops = []
+        self.latency = {}  # flush loop name: seconds taken by the last flush
+
+        for name, factory in CONTAINERS.items():
+            setattr(self, name, factory())
+
+    @property
+    def depth(self):
+        """
+        Entries waiting to be flushed.
+        """
+        return sum(len(getattr(self, name)) for name in CONTAINERS)
+
+    def swap(self, *names):
+        """
+        Replace the named containers with
+        empty ones and return the old ones.
+        """
+        batches = tuple(getattr(self, name) for name in names)
+        for name in names:
+            setattr(self, name, CONTAINERS[name]())
+        return batches
+
+
+class Histogram:
+    """
+    Fixed bucket histogram. Quantiles are
+    reported as the bucket's upper bound.
+    """
+
+    __slots__ = ("buckets", "counts", "count", "total", "max")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last one is +Inf
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        if not self.count:
+            return 0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+    def snapshot(self):
+        return {
+            "buckets": dict(zip([*map(str, self.buckets), "+Inf"], self.counts)),
+            "count": self.count,
+            "sum": self.total,
+            "max": self.max,
+        }
+
+
+class Metrics:
+    """
+    Counters and histograms for the flush loops.
+    Everything here is cumulative since the cog loaded.
+    """
+
+    def __init__(self):
+        self.rows = Counter()  # table: rows flushed
+        self.flushes = Counter()  # loop: flushes
+        self.errors = Counter()  # loop: errors
+        self.last_flush = {}  # loop: unix time of the last flush
+        self.duration = defaultdict(lambda: Histogram(LATENCY_BUCKETS))  # loop
+        self.lock_wait = defaultdict(lambda: Histogram(LATENCY_BUCKETS))  # loop
+        self.batch_rows = defaultdict(lambda: Histogram(ROW_BUCKETS))  # table
+
+    def record(self, table, rows):
+        self.rows[table] += rows
+        self.batch_rows[table].observe(rows)
+
+    def flushed(self, loop, duration, lock_wait):
+        self.flushes[loop] += 1
+        self.last_flush[loop] = time.time()
+        self.duration[loop].observe(duration)
+        self.lock_wait[loop].observe(lock_wait)
+
+    def snapshot(self):
+        return {
+            "rows": dict(self.rows),
+            "flushes": dict(self.flushes),
+            "errors": dict(self.errors),
+            "last_flush": dict(self.last_flush),
+            "duration": {k: v.snapshot() for k, v in self.duration.items()},
+            "lock_wait": {k: v.snapshot() for k, v in self.lock_wait.items()},
+            "batch_rows": {k: v.snapshot() for k, v in self.batch_rows.items()},
+        }
@@ -0,0 +1,119 @@
+import queue
+import logging
+import threading
+
+from logging.handlers import QueueHandler, RotatingFileHandler
+
+LOG_QUEUE_SIZE = 10000
+LOG_BATCH_SIZE = 256
+
+
+class BufferedRotatingFileHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler that leaves flushing
+    to the listener, once per batch of records.
+    """
+
+    def flush(self):
+        pass
+
+    def commit(self):
+        super().flush()
+
+
+class BoundedQueueHandler(QueueHandler):
+    """
+    Puts records on a bounded queue. When the queue is full
+    records are dropped and counted, or if block is set the
+    caller waits for the listener to catch up.
+    """
+
+    def __init__(self, log_queue, *, block=False):
+        super().__init__(log_queue)
+        self.block = block
+        self.dropped = 0
+
+    def enqueue(self, record):
+        if self.block:
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class BatchingQueueListener:
+    """
+    Writes queued records to the handlers on its own thread.
+    Drains up to batch_size records per wakeup and flushes
+    each handler once afterwards.
+    """
+
+    _sentinel = None
+
+    def __init__(self, log_queue, *handlers, batch_size=LOG_BATCH_SIZE):
+        self.queue = log_queue
+        self.handlers = handlers
+        self.batch_size = batch_size
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="log-listener")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Write everything queued so far and stop the thread.
+        """
+        if self._thread is None:
+            return
+        self.queue.put(self._sentinel)  # Wait for room, the queue is bounded.
+        self._thread.join()
+        self._thread = None
+
+    def handle(self, record):
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = False
+            for record in batch:
+                if record is self._sentinel:
+                    stop = True
+                else:
+                    self.handle(record)
+            for handler in self.handlers:
+                if hasattr(handler, "commit"):
+                    handler.commit()
+            if stop:
+                break
+
+
+def attach(loggers, *, block=False, maxsize=LOG_QUEUE_SIZE):
+    """
+    Route each logger's handlers through one shared queue.
+    loggers maps a logger to the file handler it should use.
+    Returns the queue handler and the started listener.
+    """
+    log_queue = queue.Queue(maxsize)
+    queue_handler = BoundedQueueHandler(log_queue, block=block)
+    handlers = []
+    for logger, handler in loggers.items():
+        handler.addFilter(logging.Filter(logger.name))
+        logger.addHandler(queue_handler)
+        handlers.append(handler)
+
+    listener = BatchingQueueListener(log_queue, *handlers)
+    listener.start()
+    return queue_handler, listener
@@ -0,0 +1,163 @@
+import os
+import re
+import time
+import hashlib
+import logging
+
+log = logging.getLogger("INFO_LOGGER")
+
+MIGRATIONS_PATH = "./data/migrations"
+
+# Migrations are named <version>_<name>.sql and applied in version order.
+FILENAME_REGEX = re.compile(r"^(\d+)_(\w+)\.sql$")
+
+# A migration starting with this line runs outside a transaction, one
+# statement at a time. CREATE INDEX CONCURRENTLY can't run inside one.
+# Statements in these files must each end with a semicolon on its own line end,
+# semicolons inside $$ quoted bodies like DO blocks don't count.
+NO_TRANSACTION = "-- migrate: no-transaction"
+
+# Held while migrating so two processes never apply the same step.
+ADVISORY_LOCK = 0x4E657574  # "Neut"
+
+
+class MigrationError(Exception):
+    """
+    Raised when an applied migration file was edited
+    or a pending migration fails to apply.
+    """
+
+
+class Migration:
+    __slots__ = ("version", "name", "sql", "checksum", "transactional")
+
+    def __init__(self, version, name, sql):
+        self.version = version
+        self.name = name
+        self.sql = sql
+        self.checksum = hashlib.sha256(sql.encode("utf-8")).hexdigest()
+        self.transactional = not sql.lstrip().startswith(NO_TRANSACTION)
+
+    def statements(self):
+        statements = []
+        current = []
+        quoted = False
+        for line in self.sql.splitlines(keepends=True):
+            current.append(line)
+            quoted ^= line.count("$$") % 2 == 1
+            if not quoted and line.rstrip().endswith(";"):
+                statements.append("".join(current))
+                current = []
+        statements.append("".join(current))
+        return [
+            statement.strip()
+            for statement in statements
+            if statement.strip()
+            and not all(
+                line.strip().startswith("--") or not line.strip()
+                for line in statement.splitlines()
+            )
+        ]
+
+
+def load(path=MIGRATIONS_PATH):
+    """
+    Read every migration file in version order.
+    """
+    migrations = []
+    for filename in os.listdir(path):
+        match = FILENAME_REGEX.match(filename)
+        if not match:
+            continue
+        with open(os.path.join(path, filename), "r", encoding="utf-8") as fp:
+            migrations.append(Migration(int(match.group(1)), match.group(2), fp.read()))
+
+    migrations.sort(key=lambda m: m.version)
+    versions = [m.version for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise MigrationError(f"Duplicate migration versions in {path}")
+    return migrations
+
+
+async def applied(cxn):
+    """
+    Get {version: record} of the migrations already applied.
+    """
+    query = """
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                checksum TEXT NOT NULL,
+                duration DOUBLE PRECISION,
+                applied_at TIMESTAMP DEFAULT (NOW() AT TIME ZONE 'UTC')
+            );
+            """
+    await cxn.execute(query)
+    query = """
+            SELECT version, name, checksum, duration, applied_at
+            FROM schema_migrations;
+            """
+    return {record["version"]: record for record in await cxn.fetch(query)}
+
+
+async def migrate(pool, path=MIGRATIONS_PATH):
+    """
+    Apply every pending migration in order.
+    Returns the migrations that were applied.
+    """
+    migrations = load(path)
+    done = []
+    async with pool.acquire() as conn:
+        await conn.execute("SET statement_timeout = 0;")  # Index builds run long
+        await conn.execute("SELECT pg_advisory_lock($1);", ADVISORY_LOCK)
+        try:
+            records = await applied(conn)
+            for migration in migrations:
+                record = records.get(migration.version)
+                if record is None:
+                    await apply(conn, migration)
+                    done.append(migration)
+                elif record["checksum"] != migration.checksum:
+                    raise MigrationError(
+                        f"Migration {migration.version}_{migration.name} "
+                        "was edited after it was applied."
+                    )
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock($1);", ADVISORY_LOCK)
+    return done
+
+
+async def apply(conn, migration):
+    st = time.time()
+    query = """
+            INSERT INTO schema_migrations (version, name, checksum, duration)
+            VALUES ($1, $2, $3, $4);
+            """
+    try:
+        if migration.transactional:
+            async with conn.transaction():
+                await conn.execute(migration.sql)
+                await conn.execute(
+                    query,
+                    migration.version,
+                    migration.name,
+                    migration.checksum,
+                    time.time() - st,
+                )
+            duration = time.time() - st
+        else:
+            # Each statement commits on its own, so these
+            # migrations must be safe to run again if one fails.
+            for statement in migration.statements():
+                await conn.execute(statement)
+            duration = time.time() - st
+            await conn.execute(
+                query, migration.version, migration.name, migration.checksum, duration
+            )
+    except Exception as e:
+        raise MigrationError(
+            f"Migration {migration.version}_{migration.name} failed: {e}"
+        ) from e
+    log.info(
+        f"Applied migration {migration.version}_{migration.name} in {duration:.2f}s"
+    )
@@ -0,0 +1,66 @@
+import asyncpg
+import contextlib
+
+# Separate pools so one workload can't starve the others of
+# connections. statement_timeout is in milliseconds, 0 is none.
+# Any of these can be overridden with config.POSTGRES_POOLS.
+POOLS = {
+    # Commands and everything else that a user waits on.
+    "interactive": {"min_size": 4, "max_size": 10, "statement_timeout": 15000},
+    # Batch flushes, the message backfill and erasure jobs.
+    "ingest": {"min_size": 2, "max_size": 6, "statement_timeout": 120000},
+    # Heavy aggregations like messagestats and the command history.
+    "analytics": {"min_size": 1, "max_size": 4, "statement_timeout": 30000},
+}
+
+
+async def create_pools(dsn, *, analytics_dsn=None, overrides=None):
+    """
+    Create a pool for each workload in POOLS.
+    Analytics can be pointed at a replica
+    with analytics_dsn. Returns {name: pool}.
+    """
+    pools = {}
+    for name, options in POOLS.items():
+        options = {**options, **(overrides or {}).get(name, {})}
+        pools[name] = await asyncpg.create_pool(
+            analytics_dsn if name == "analytics" and analytics_dsn else dsn,
+            min_size=options["min_size"],
+            max_size=options["max_size"],
+            server_settings={
+                "statement_timeout": str(options["statement_timeout"]),
+                "application_name": f"neutra-{name}",
+            },
+        )
+    return pools
+
+
+def saturation(pools):
+    """
+    Get {name: usage} for each pool. busy is the number
+    of connections checked out and saturation is busy
+    over the pool's max size.
+    """
+    stats = {}
+    for name, pool in pools.items():
+        size = pool.get_size()
+        busy = size - pool.get_idle_size()
+        stats[name] = {
+            "size": size,
+            "busy": busy,
+            "max": pool.get_max_size(),
+            "saturation": busy / pool.get_max_size(),
+        }
+    return stats
+
+
+@contextlib.asynccontextmanager
+async def unbounded(pool):
+    """
+    Acquire a connection without a statement timeout, for
+    maintenance work that is expected to run long. The
+    timeout is restored when the connection is released.
+    """
+    async with pool.acquire() as conn:
+        await conn.execute("SET statement_timeout = 0;")
+        yield conn
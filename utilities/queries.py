@@ -0,0 +1,166 @@
+# Analytics queries run by the tracking, stats and batch cogs.
+# Kept in one place so the database cog's benchmark plans command
+# explains exactly the statements the bot executes.
+
+# Messages
+
+MESSAGE_COUNT = """
+                SELECT COUNT(*)
+                FROM messages
+                WHERE author_id = $1
+                AND server_id = $2;
+                """
+
+USER_MESSAGE_COUNT = """
+                SELECT COUNT(*)
+                FROM messages
+                WHERE author_id = $1;
+                """
+
+LAST_SPOKE = """
+                SELECT snowflake_unix(MAX(message_id))
+                FROM messages
+                WHERE author_id = $1;
+                """
+
+SERVER_LAST_SPOKE = """
+                SELECT snowflake_unix(MAX(message_id))
+                FROM messages
+                WHERE author_id = $1
+                AND server_id = $2;
+                """
+
+TOP_SENDERS = """
+                SELECT author_id,
+                SUM(total)::BIGINT
+                FROM message_rollups
+                WHERE server_id = $1
+                GROUP BY author_id
+                ORDER BY SUM(total)
+                DESC LIMIT $2;
+                """
+
+MESSAGE_LEADERBOARD = """
+                SELECT SUM(total)::BIGINT as c, author_id
+                FROM message_rollups
+                WHERE server_id = $1
+                AND hour >= $2
+                GROUP BY author_id
+                ORDER BY c DESC LIMIT 25;
+                """
+
+MESSAGE_STATS = """
+                SELECT SUM(total)::BIGINT as c, author_id as author
+                FROM message_rollups
+                WHERE server_id = $1
+                AND hour >= $2
+                GROUP BY author_id
+                ORDER BY c DESC
+                LIMIT 100;
+                """
+
+CHANNEL_MESSAGE_STATS = """
+                SELECT SUM(total)::BIGINT as c, author_id as author
+                FROM message_rollups
+                WHERE server_id = $1
+                AND hour >= $2
+                AND channel_id = $3
+                GROUP BY author_id
+                ORDER BY c DESC
+                LIMIT 100;
+                """
+
+CHANNEL_STATS = """
+                SELECT SUM(total)::BIGINT as c, channel_id
+                FROM message_rollups
+                WHERE server_id = $1
+                AND hour >= $2
+                GROUP BY channel_id
+                ORDER BY c DESC;
+                """
+
+CLOCKER = """
+                SELECT COALESCE((
+                    SELECT active_days(days, day, $3, 30)
+                    FROM activity_days
+                    WHERE server_id = $1
+                    AND user_id = $2
+                ), 0);
+                """
+
+CLOCKING = """
+                SELECT user_id AS user, active_days(days, day, $2, 30) AS days
+                FROM activity_days
+                WHERE server_id = $1
+                AND day > $2 - 30
+                ORDER BY days DESC;
+                """
+
+# Commands
+
+COMMAND_COUNT = """
+                SELECT COUNT(*)
+                FROM commands
+                WHERE author_id = $1
+                AND server_id = $2;
+                """
+
+USER_COMMAND_COUNT = """
+                SELECT COUNT(*)
+                FROM commands
+                WHERE author_id = $1;
+                """
+
+SERVER_COMMAND_COUNT = """
+                SELECT COUNT(*)
+                FROM commands
+                WHERE server_id = $1;
+                """
+
+COMMAND_STATS = """
+                SELECT command, SUM(total)::BIGINT as c
+                FROM command_rollups
+                WHERE server_id = $1
+                GROUP BY command
+                ORDER BY c DESC
+                LIMIT $2;
+                """
+
+USER_COMMAND_STATS = """
+                SELECT command, SUM(total)::BIGINT as c
+                FROM command_rollups
+                WHERE server_id = $1
+                AND author_id = $2
+                GROUP BY command
+                ORDER BY c DESC
+                LIMIT $3;
+                """
+
+BOT_USAGE = """
+                SELECT SUM(total)::BIGINT as c, author_id
+                FROM command_rollups
+                WHERE server_id = $1
+                GROUP BY author_id
+                ORDER BY c DESC LIMIT 25;
+                """
+
+# Every query above with the parameters it takes, by name.
+ANALYTICS = {
+    "messagecount": (MESSAGE_COUNT, ("author", "server")),
+    "user messagecount": (USER_MESSAGE_COUNT, ("author",)),
+    "last_spoke": (LAST_SPOKE, ("author",)),
+    "server_last_spoke": (SERVER_LAST_SPOKE, ("author", "server")),
+    "top": (TOP_SENDERS, ("server", "limit")),
+    "activity": (MESSAGE_LEADERBOARD, ("server", "hour")),
+    "messagestats": (MESSAGE_STATS, ("server", "hour")),
+    "messagestats channel": (CHANNEL_MESSAGE_STATS, ("server", "hour", "channel")),
+    "channelstats": (CHANNEL_STATS, ("server", "hour")),
+    "clocker": (CLOCKER, ("server", "author", "day")),
+    "clocking": (CLOCKING, ("server", "day")),
+    "commandcount": (COMMAND_COUNT, ("author", "server")),
+    "user commandcount": (USER_COMMAND_COUNT, ("author",)),
+    "server commandcount": (SERVER_COMMAND_COUNT, ("server",)),
+    "commandstats": (COMMAND_STATS, ("server", "limit")),
+    "commandstats user": (USER_COMMAND_STATS, ("server", "author", "limit")),
+    "botusage": (BOT_USAGE, ("server",)),
+}
@@ -0,0 +1,279 @@
+import os
+import time
+import pickle
+import asyncio
+import asyncpg
+import logging
+
+from collections import Counter, deque
+
+log = logging.getLogger("INFO_LOGGER")
+
+SEGMENT_BYTES = 4 * 1024 * 1024  # 4 MiB
+MAX_PENDING_ROWS = 100000
+# Writes spent splitting a failed batch to find its bad rows.
+# Whatever is left unsplit after that is quarantined as is.
+MAX_SPLIT_WRITES = 64
+
+# Errors that mean postgres is unreachable, not that the batch is bad.
+OUTAGE_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    asyncpg.InterfaceError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.CannotConnectNowError,
+    asyncpg.TooManyConnectionsError,
+)
+
+
+class CircuitBreaker:
+    """
+    Stops writes to postgres after repeated failures
+    and lets an attempt through every cooldown seconds.
+    """
+
+    def __init__(self, threshold=3, cooldown=30):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        return self.state != "open"
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def failure(self):
+        self.failures += 1
+        if self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+
+class Spool:
+    """
+    Segmented append only log of batches on disk.
+    Segments are replayed oldest first and removed once written.
+    """
+
+    def __init__(self, path, segment_bytes=SEGMENT_BYTES):
+        self.path = path
+        self.segment_bytes = segment_bytes
+
+        os.makedirs(path, exist_ok=True)
+        self._segments = sorted(x for x in os.listdir(path) if x.endswith(".spool"))
+        self.index = int(self._segments[-1][:-6]) + 1 if self._segments else 0
+
+    def __bool__(self):
+        return bool(self._segments)
+
+    @property
+    def current(self):
+        return f"{self.index:010d}.spool"
+
+    def segments(self):
+        return list(self._segments)
+
+    def append(self, kind, rows):
+        filename = os.path.join(self.path, self.current)
+        with open(filename, "ab") as fp:
+            pickle.dump((kind, rows), fp, protocol=pickle.HIGHEST_PROTOCOL)
+            size = fp.tell()
+        if self.current not in self._segments:
+            self._segments.append(self.current)
+        if size >= self.segment_bytes:
+            self.seal()
+
+    def seal(self):
+        """
+        Start a new segment so the
+        current one can be replayed.
+        """
+        if self.current in self._segments:
+            self.index += 1
+
+    def read(self, segment):
+        batches = []
+        with open(os.path.join(self.path, segment), "rb") as fp:
+            while True:
+                try:
+                    batches.append(pickle.load(fp))
+                except EOFError:
+                    break
+                except Exception:  # Torn write from a crash, keep what we have.
+                    log.warning(f"Spool segment {segment} is truncated.")
+                    break
+        return batches
+
+    def rewrite(self, segment, batches):
+        filename = os.path.join(self.path, segment)
+        with open(filename + ".tmp", "wb") as fp:
+            for batch in batches:
+                pickle.dump(batch, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(filename + ".tmp", filename)
+
+    def remove(self, segment):
+        os.remove(os.path.join(self.path, segment))
+        self._segments.remove(segment)
+
+
+class DurableWriter:
+    """
+    Writes batches to postgres through a circuit breaker.
+    Failed batches wait in a bounded memory queue and are
+    spilled to a Spool on overflow or while postgres is down.
+    Rows postgres rejects are set aside in a quarantine Spool.
+    """
+
+    def __init__(self, writers, path, *, max_rows=MAX_PENDING_ROWS, error_handler=None):
+        self.writers = writers  # kind -> coroutine function taking rows
+        self.spool = Spool(path)
+        self.quarantine = Spool(os.path.join(path, "quarantine"))
+        self.breaker = CircuitBreaker()
+        self.max_rows = max_rows
+        self.error_handler = error_handler
+
+        self.pending = deque()
+        self.pending_rows = 0
+        self.stats = Counter()  # Rows queued, spilled, replayed and quarantined
+
+    @property
+    def backlog(self):
+        return bool(self.pending) or bool(self.spool)
+
+    async def write(self, kind, rows):
+        if self.backlog or not self.breaker.allow():
+            # Wait behind the older batches to keep them in order.
+            return self.defer(kind, rows)
+        unwritten = await self.attempt(kind, rows, replay=False)
+        if unwritten:
+            self.defer(kind, unwritten)
+
+    async def attempt(self, kind, rows, *, replay):
+        """
+        Returns the rows left unwritten if postgres was
+        unreachable, None otherwise. Batches that fail for
+        any other reason are split to find the bad rows.
+        """
+        writer = self.writers.get(kind)
+        if writer is None:
+            log.warning(f"Dropping {len(rows)} rows of unknown kind {kind}.")
+            return None
+        try:
+            await writer(rows)
+        except OUTAGE_ERRORS as e:
+            self.breaker.failure()
+            log.warning(f"Postgres unavailable writing {kind}: {e}")
+            return rows
+        except Exception as e:
+            if self.error_handler:
+                self.error_handler(e)
+            return await self.split(kind, rows, replay=replay)
+        self.breaker.success()
+        if replay:
+            self.stats["replayed"] += len(rows)
+        return None
+
+    async def split(self, kind, rows, *, replay):
+        """
+        Write a batch postgres rejected in halves until the rows
+        it rejects are found, and quarantine those. Returns the
+        rows left unwritten if postgres became unreachable.
+        """
+        writer = self.writers[kind]
+        rows = list(rows)
+        rejected = []
+        halves = [rows[len(rows) // 2 :], rows[: len(rows) // 2]]
+        writes = 0
+        while halves:
+            half = halves.pop()
+            if not half:
+                continue
+            if writes >= MAX_SPLIT_WRITES:
+                rejected.extend(half)
+                continue
+            writes += 1
+            try:
+                await writer(half)
+            except OUTAGE_ERRORS as e:
+                self.breaker.failure()
+                log.warning(f"Postgres unavailable writing {kind}: {e}")
+                self.isolate(kind, rejected)
+                return half + [row for rest in reversed(halves) for row in rest]
+            except Exception:
+                if len(half) == 1:
+                    rejected.extend(half)
+                else:
+                    halves.append(half[len(half) // 2 :])
+                    halves.append(half[: len(half) // 2])
+            else:
+                if replay:
+                    self.stats["replayed"] += len(half)
+        self.isolate(kind, rejected)
+        return None
+
+    def isolate(self, kind, rows):
+        if rows:
+            self.quarantine.append(kind, rows)
+            self.stats["quarantined"] += len(rows)
+            log.warning(
+                f"Quarantined {len(rows)} {kind} rows in {self.quarantine.path}."
+            )
+
+    def defer(self, kind, rows):
+        if not self.breaker.allow() or self.pending_rows + len(rows) > self.max_rows:
+            self.spill()
+            self.spool.append(kind, rows)
+            self.stats["spilled"] += len(rows)
+        else:
+            self.pending.append((kind, rows))
+            self.pending_rows += len(rows)
+            self.stats["queued"] += len(rows)
+
+    def spill(self):
+        """
+        Move the memory queue to disk, oldest first.
+        """
+        while self.pending:
+            kind, rows = self.pending.popleft()
+            self.spool.append(kind, rows)
+            self.stats["spilled"] += len(rows)
+        self.pending_rows = 0
+
+    async def replay(self):
+        """
+        Write the backlog to postgres in order,
+        stopping at the first sign of an outage.
+        """
+        if not self.backlog or not self.breaker.allow():
+            return
+
+        self.spool.seal()
+        for segment in self.spool.segments():
+            batches = self.spool.read(segment)
+            for index, (kind, rows) in enumerate(batches):
+                unwritten = await self.attempt(kind, rows, replay=True)
+                if unwritten:
+                    self.spool.rewrite(
+                        segment, [(kind, unwritten)] + batches[index + 1 :]
+                    )
+                    return
+            self.spool.remove(segment)
+
+        while self.pending:
+            kind, rows = self.pending.popleft()
+            self.pending_rows -= len(rows)
+            unwritten = await self.attempt(kind, rows, replay=True)
+            if unwritten:
+                self.pending.appendleft((kind, unwritten))
+                self.pending_rows += len(unwritten)
+                return
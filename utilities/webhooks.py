@@ -0,0 +1,221 @@
+import time
+import asyncio
+import discord
+
+from collections import deque
+
+from utilities import ingest
+from utilities import utils
+
+# A webhook message holds up to this many embeds and files,
+# and up to EMBED_LIMIT characters across its embeds.
+BATCH_SIZE = 10
+EMBED_LIMIT = 6000
+# Queued objects wait at most this long for a full batch.
+FLUSH_DELAY = 1.0
+# Workers exit after this many idle seconds.
+WORKER_IDLE = 60.0
+# Sends in flight across every webhook.
+MAX_CONCURRENCY = 16
+# Oldest objects are dropped past this many queued per webhook.
+QUEUE_SIZE = 500
+
+# End to end delivery latency buckets, seconds.
+DELIVERY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def clip(data, key, limit):
+    """
+    Cut data[key] down to limit characters.
+    Returns True if it had to be cut.
+    """
+    text = data.get(key)
+    if not text or len(text) <= limit:
+        return False
+    data[key] = text[: limit - 3] + "..." if limit > 3 else text[:limit]
+    return True
+
+
+def fit(embed):
+    """
+    Truncate an embed to discord's limits, so
+    it can't get a whole message rejected.
+    """
+    data = embed.to_dict()
+    fields = data.get("fields", [])
+    clipped = any(
+        [
+            clip(data, "title", 256),
+            clip(data, "description", 4096),
+            clip(data.get("footer", {}), "text", 2048),
+            clip(data.get("author", {}), "name", 256),
+            len(fields) > 25,
+        ]
+        + [clip(field, "name", 256) for field in fields]
+        + [clip(field, "value", 1024) for field in fields]
+    )
+    if not clipped and len(embed) <= EMBED_LIMIT:
+        return embed
+
+    data["fields"] = fields[:25]
+    embed = discord.Embed.from_dict(data)
+    while len(embed) > EMBED_LIMIT and data["fields"]:  # The description goes last
+        data["fields"].pop()
+        embed = discord.Embed.from_dict(data)
+    overflow = len(embed) - EMBED_LIMIT
+    if overflow > 0 and data.get("description"):
+        clip(data, "description", max(len(data["description"]) - overflow, 0))
+        embed = discord.Embed.from_dict(data)
+    return embed
+
+
+def pack(batch):
+    """
+    Split a batch into messages that each
+    stay within EMBED_LIMIT characters.
+    """
+    messages = []
+    current = []
+    size = 0
+    for item in batch:
+        length = len(item[1]) if isinstance(item[1], discord.Embed) else 0
+        if current and size + length > EMBED_LIMIT:
+            messages.append(current)
+            current = []
+            size = 0
+        current.append(item)
+        size += length
+    if current:
+        messages.append(current)
+    return messages
+
+
+class Outbox:
+    """
+    Pending objects for one webhook and the worker sending them.
+    """
+
+    __slots__ = ("queue", "wakeup", "worker")
+
+    def __init__(self):
+        self.queue = deque(maxlen=QUEUE_SIZE)  # (enqueued at, embed or file)
+        self.wakeup = asyncio.Event()
+        self.worker = None
+
+
+class Dispatcher:
+    """
+    Sends log embeds and files with one worker per webhook,
+    so a slow or rate limited guild only holds up itself.
+    A worker sends as soon as a full batch is queued, or
+    FLUSH_DELAY after the oldest object was queued.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.outboxes = {}  # webhook: Outbox
+        self.semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+        self.latency = ingest.Histogram(DELIVERY_BUCKETS)
+        self.dropped = 0
+
+    @property
+    def queued(self):
+        return sum(len(outbox.queue) for outbox in self.outboxes.values())
+
+    def send(self, webhook, obj):
+        if isinstance(obj, discord.Embed):
+            obj = fit(obj)
+        outbox = self.outboxes.get(webhook)
+        if outbox is None:
+            outbox = self.outboxes[webhook] = Outbox()
+        if len(outbox.queue) == QUEUE_SIZE:
+            self.dropped += 1
+        outbox.queue.append((time.monotonic(), obj))
+
+        if outbox.worker is None:
+            outbox.worker = self.bot.loop.create_task(self.work(webhook, outbox))
+        elif len(outbox.queue) == 1 or len(outbox.queue) >= BATCH_SIZE:
+            outbox.wakeup.set()
+
+    def drop(self, webhook):
+        """
+        Forget a webhook's pending objects and stop its worker.
+        """
+        outbox = self.outboxes.pop(webhook, None)
+        if outbox and outbox.worker:
+            outbox.worker.cancel()
+
+    def close(self):
+        for webhook in list(self.outboxes):
+            self.drop(webhook)
+
+    async def work(self, webhook, outbox):
+        queue = outbox.queue
+        while True:
+            if not queue:
+                outbox.wakeup.clear()
+                try:
+                    await asyncio.wait_for(outbox.wakeup.wait(), WORKER_IDLE)
+                except asyncio.TimeoutError:
+                    break
+
+            if len(queue) < BATCH_SIZE:
+                outbox.wakeup.clear()
+                delay = FLUSH_DELAY - (time.monotonic() - queue[0][0])
+                if delay > 0:
+                    try:  # Set early once a full batch is queued.
+                        await asyncio.wait_for(outbox.wakeup.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+
+            batch = [queue.popleft() for _ in range(min(BATCH_SIZE, len(queue)))]
+            async with self.semaphore:
+                retry_after, unsent = await self.deliver(webhook, batch)
+            if retry_after:  # Out of retries on a 429, put it back and wait.
+                # Newer objects were queued meanwhile, the oldest go if full.
+                free = QUEUE_SIZE - len(queue)
+                if len(unsent) > free:
+                    self.dropped += len(unsent) - free
+                    unsent = unsent[len(unsent) - free :]
+                queue.extendleft(reversed(unsent))
+                await asyncio.sleep(retry_after)
+
+        if self.outboxes.get(webhook) is outbox:
+            del self.outboxes[webhook]
+
+    async def deliver(self, webhook, batch):
+        """
+        Send a batch in as few messages as fit. If the webhook is
+        rate limited, returns the seconds to wait before retrying
+        and the objects that were not sent, otherwise (None, []).
+        """
+        sent = 0
+        for message in pack(batch):
+            try:
+                # discord.py already waits out each webhook's rate limit bucket.
+                await webhook.send(
+                    embeds=[
+                        obj for _, obj in message if isinstance(obj, discord.Embed)
+                    ],
+                    files=[obj for _, obj in message if isinstance(obj, discord.File)],
+                    username=f"{self.bot.user.name}-logger",
+                    avatar_url=self.bot.user.display_avatar.url,
+                )
+            except discord.NotFound:  # Raised when users manually delete the webhook.
+                return None, []
+            except discord.HTTPException as e:
+                if e.status == 429:
+                    retry_after = e.response.headers.get("Retry-After", FLUSH_DELAY)
+                    # The files of this message were closed by the attempt.
+                    unsent = [x for x in message if isinstance(x[1], discord.Embed)]
+                    return float(retry_after), unsent + batch[sent + len(message) :]
+                # Embeds are already fit to the limits, so this is unexpected.
+                self.bot.dispatch("error", "logging_error", tb=utils.traceback_maker(e))
+            except Exception as e:
+                self.bot.dispatch("error", "logging_error", tb=utils.traceback_maker(e))
+
+            sent += len(message)
+            now = time.monotonic()
+            for enqueued, _ in message:
+                self.latency.observe(now - enqueued)
+        return None, []